@@ -1,8 +1,9 @@
 """Segments API endpoints."""
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional
 import logging
+from psycopg2.extras import execute_values
 
 from backend.models.database import get_db, Segment, Override, User, StyleMemory
 from backend.api.schemas import (
@@ -17,14 +18,69 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/segments", tags=["segments"])
 
 
-def calculate_and_store_segment_metrics(segment: Segment, db: Session) -> None:
-    """Calculate and store metrics for a segment, including word-level change tracking."""
+# Segment columns written by calculate_and_store_segment_metrics, with their SQL types
+SEGMENT_METRIC_COLUMNS = (
+    ("style_similarity_score", "float8"),
+    ("from_style_memory", "boolean"),
+    ("has_override", "boolean"),
+    ("override_similarity_score", "float8"),
+    ("override_percentage", "float8"),
+    ("translation_source", "varchar"),
+)
+
+
+def segment_metrics_row(segment: Segment) -> tuple:
+    """Get (id, *metric columns) for a segment, for use with bulk_update_segment_metrics."""
+    return (segment.id,) + tuple(getattr(segment, column) for column, _ in SEGMENT_METRIC_COLUMNS)
+
+
+def bulk_update_segment_metrics(cursor, rows: List[tuple], page_size: int = 1000) -> None:
+    """Write segment_metrics_row tuples with one UPDATE ... FROM (VALUES ...) per page."""
+    if not rows:
+        return
+    
+    columns = [column for column, _ in SEGMENT_METRIC_COLUMNS]
+    set_clause = ", ".join(f"{column} = v.{column}" for column in columns)
+    # Cast explicitly so pages where a column is all NULL still type-check
+    template = "(%s, " + ", ".join(f"%s::{sql_type}" for _, sql_type in SEGMENT_METRIC_COLUMNS) + ")"
+    
+    execute_values(
+        cursor,
+        f"""
+            UPDATE segments AS s SET {set_clause}
+            FROM (VALUES %s) AS v(id, {", ".join(columns)})
+            WHERE s.id = v.id
+        """,
+        rows,
+        template=template,
+        page_size=page_size
+    )
+
+
+def calculate_and_store_segment_metrics(
+    segment: Segment,
+    db: Session,
+    flush: bool = True,
+    embeddings=None,
+    id_to_row: Optional[Dict[int, int]] = None
+) -> None:
+    """
+    Calculate and store metrics for a segment, including word-level change tracking.
+    
+    Pass flush=False from batch jobs to leave writing the changes to the caller.
+    Batch jobs can also pass precomputed source_en embeddings (one row per
+    segment, located via id_to_row) so style memory lookups skip encoding.
+    """
     from backend.services.metrics import get_metrics_service
     metrics_service = get_metrics_service()
     
     if not segment.translated_az:
         return
     
+    source_embedding = None
+    if embeddings is not None and id_to_row is not None and segment.id in id_to_row:
+        source_embedding = embeddings[id_to_row[segment.id]]
+    
     # Check if segment has override(s)
     all_overrides = db.query(Override).filter(
         Override.segment_id == segment.id
@@ -79,7 +135,9 @@ def calculate_and_store_segment_metrics(segment: Segment, db: Session) -> None:
                     style_memory_service = get_style_memory_service()
                     
                     # Check if ORIGINAL translation (before any override) matches style memory
-                    nearest = style_memory_service.find_nearest(segment.source_en, k=1, threshold=0.50)
+                    nearest = style_memory_service.find_nearest(
+                        segment.source_en, k=1, threshold=0.50, query_embedding=source_embedding
+                    )
                     if nearest:
                         entry, similarity = nearest[0]
                         # Calculate how similar the ORIGINAL translation (before any override) was to style memory
@@ -153,7 +211,9 @@ def calculate_and_store_segment_metrics(segment: Segment, db: Session) -> None:
             
             # Use lower threshold to find more matches (0.50 instead of 0.70)
             # This allows segments from training data to match style memory entries
-            nearest = style_memory_service.find_nearest(segment.source_en, k=1, threshold=0.50)
+            nearest = style_memory_service.find_nearest(
+                segment.source_en, k=1, threshold=0.50, query_embedding=source_embedding
+            )
             if nearest:
                 entry, similarity = nearest[0]
                 # Calculate translation similarity (how similar is the actual translation to style memory)
@@ -198,7 +258,8 @@ def calculate_and_store_segment_metrics(segment: Segment, db: Session) -> None:
             segment.style_similarity_score = None
     
     # Flush changes but don't commit - let the caller commit
-    db.flush()
+    if flush:
+        db.flush()
 
 
 @router.get("/book/{book_id}", response_model=SegmentListResponse)
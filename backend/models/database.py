@@ -1,5 +1,5 @@
 """Database models using SQLAlchemy."""
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, Boolean, Date, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, Float, Boolean, Date, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
@@ -79,7 +79,7 @@ class StyleMemory(Base):
     __tablename__ = "style_memory"
     
     id = Column(Integer, primary_key=True, index=True)
-    segment_id = Column(Integer, ForeignKey("segments.id", ondelete="SET NULL"), nullable=True)
+    segment_id = Column(Integer, ForeignKey("segments.id", ondelete="SET NULL"), nullable=True, unique=True)
     source_en = Column(Text, nullable=False, index=True)
     preferred_az = Column(Text, nullable=False)
     embedding = Column(Vector(768))
@@ -110,6 +110,11 @@ class Override(Base):
     # Relationships
     segment = relationship("Segment", back_populates="overrides")
     user = relationship("User", back_populates="overrides")
+    
+    __table_args__ = (
+        # Latest override per segment (DISTINCT ON / ORDER BY ... LIMIT 1)
+        Index("idx_overrides_segment_created", "segment_id", created_at.desc()),
+    )
 
 
 class TrainingRun(Base):
@@ -3,6 +3,7 @@ import psycopg2
 from psycopg2.extras import execute_values
 from sentence_transformers import SentenceTransformer
 from typing import List, Tuple, Optional
+from functools import lru_cache
 import logging
 import numpy as np
 from config.settings import settings
@@ -15,9 +16,15 @@ class StyleMemoryService:
     
     def __init__(self):
         self.embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        # Memoize query embeddings; the same source is often looked up repeatedly
+        self._embed_query = lru_cache(maxsize=10_000)(self._encode_query)
         self.conn = None
         self._connect()
     
+    def _encode_query(self, text: str) -> str:
+        """Encode a query text as a pgvector literal."""
+        return str(self.embedding_model.encode([text])[0].tolist())
+    
     def _connect(self):
         """Connect to PostgreSQL database."""
         try:
@@ -42,7 +49,13 @@ class StyleMemoryService:
         engine: Optional[str] = None,
         similarity_score: Optional[float] = None
     ) -> int:
-        """Add a new entry to style memory."""
+        """
+        Add a new entry to style memory.
+        
+        A segment has at most one entry (UNIQUE segment_id). Adding another for
+        the same segment, e.g. a repeat override, replaces the earlier approved
+        translation, embedding, approver and engine; the old entry is not kept.
+        """
         try:
             # Generate embedding
             embedding = self.embedding_model.encode([source_en])[0]
@@ -53,6 +66,14 @@ class StyleMemoryService:
                 INSERT INTO style_memory 
                 (segment_id, source_en, preferred_az, embedding, approved_by, engine, similarity_score)
                 VALUES (%s, %s, %s, %s::vector, %s, %s, %s)
+                ON CONFLICT (segment_id) DO UPDATE SET
+                    source_en = EXCLUDED.source_en,
+                    preferred_az = EXCLUDED.preferred_az,
+                    embedding = EXCLUDED.embedding,
+                    approved_by = EXCLUDED.approved_by,
+                    engine = EXCLUDED.engine,
+                    similarity_score = EXCLUDED.similarity_score,
+                    approved_at = CURRENT_TIMESTAMP
                 RETURNING id
             """, (segment_id, source_en, preferred_az, str(embedding_list), approved_by, engine, similarity_score))
             
@@ -68,22 +89,119 @@ class StyleMemoryService:
             logger.error(f"Error adding style memory: {e}")
             raise
     
+    def add_memory_batch(
+        self,
+        sources: List[str],
+        targets: List[str],
+        segment_ids: Optional[List[Optional[int]]] = None,
+        approved_by: Optional[List[Optional[int]]] = None,
+        engines: Optional[List[Optional[str]]] = None,
+        dedupe_threshold: Optional[float] = None,
+        batch_size: int = 256
+    ) -> List[int]:
+        """
+        Add many entries to style memory with one batched encode and insert.
+        
+        If dedupe_threshold is set, entries whose nearest existing entry (or an
+        earlier entry in the same batch) has at least that similarity are skipped.
+        Entries for segments that already have one are skipped by the database.
+        
+        Returns:
+            List of ids of the inserted entries
+        """
+        if not sources:
+            return []
+        
+        count = len(sources)
+        segment_ids = segment_ids or [None] * count
+        approved_by = approved_by or [None] * count
+        engines = engines or [None] * count
+        
+        try:
+            embeddings = self.embedding_model.encode(
+                sources,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            vectors = [str(embedding.tolist()) for embedding in embeddings]
+            
+            cursor = self.conn.cursor()
+            
+            keep = list(range(count))
+            if dedupe_threshold is not None:
+                # Nearest existing entry for every query in a single round-trip
+                nearest = execute_values(cursor, """
+                    SELECT q.idx, (
+                        SELECT 1 - (sm.embedding <=> q.embedding)
+                        FROM style_memory sm
+                        ORDER BY sm.embedding <=> q.embedding
+                        LIMIT 1
+                    )
+                    FROM (VALUES %s) AS q(idx, embedding)
+                """, list(enumerate(vectors)), template="(%s, %s::vector)", page_size=batch_size, fetch=True)
+                existing_similarity = {idx: similarity for idx, similarity in nearest}
+                
+                # Embeddings are normalized, so the dot product is the cosine similarity
+                batch_similarity = embeddings @ embeddings.T
+                keep = []
+                for idx in range(count):
+                    similarity = existing_similarity.get(idx)
+                    if similarity is not None and similarity >= dedupe_threshold:
+                        continue
+                    if keep and batch_similarity[idx, keep].max() >= dedupe_threshold:
+                        continue
+                    keep.append(idx)
+            
+            if not keep:
+                cursor.close()
+                return []
+            
+            rows = [
+                (segment_ids[idx], sources[idx], targets[idx], vectors[idx], approved_by[idx], engines[idx])
+                for idx in keep
+            ]
+            inserted = execute_values(cursor, """
+                INSERT INTO style_memory 
+                (segment_id, source_en, preferred_az, embedding, approved_by, engine)
+                VALUES %s
+                ON CONFLICT (segment_id) DO NOTHING
+                RETURNING id
+            """, rows, template="(%s, %s, %s, %s::vector, %s, %s)", page_size=batch_size, fetch=True)
+            
+            self.conn.commit()
+            cursor.close()
+            
+            memory_ids = [row[0] for row in inserted]
+            logger.info(f"Added {len(memory_ids)} style memory entries")
+            return memory_ids
+        
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error adding style memory batch: {e}")
+            raise
+    
     def find_nearest(
         self,
         source_en: str,
         k: int = 5,
-        threshold: float = 0.7
+        threshold: float = 0.7,
+        query_embedding: Optional[np.ndarray] = None
     ) -> List[Tuple[dict, float]]:
         """
         Find nearest style memory entries.
         
+        Pass a precomputed query_embedding of source_en to skip encoding it.
+        
         Returns:
             List of (entry_dict, similarity_score) tuples
         """
         try:
             # Generate embedding for query
-            query_embedding = self.embedding_model.encode([source_en])[0]
-            query_embedding_list = query_embedding.tolist()
+            if query_embedding is not None:
+                query_embedding = str(np.asarray(query_embedding).tolist())
+            else:
+                query_embedding = self._embed_query(source_en)
             
             cursor = self.conn.cursor()
             cursor.execute("""
@@ -95,7 +213,7 @@ class StyleMemoryService:
                 WHERE 1 - (embedding <=> %s::vector) >= %s
                 ORDER BY embedding <=> %s::vector
                 LIMIT %s
-            """, (str(query_embedding_list), str(query_embedding_list), threshold, str(query_embedding_list), k))
+            """, (query_embedding, query_embedding, threshold, query_embedding, k))
             
             results = []
             for row in cursor.fetchall():
@@ -3,7 +3,7 @@ import re
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 from peft import PeftModel
-from typing import Optional
+from typing import List, Optional
 import logging
 from pathlib import Path
 from config.settings import settings
@@ -53,10 +53,17 @@ class TranslationService:
                 tgt_lang="aze_Latn"
             )
             
+            # bf16 on GPUs that support it (same range as fp32, no overflow in
+            # generation), fp16 on older GPUs, fp32 on CPU
+            if self.device == "cuda":
+                dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            else:
+                dtype = torch.float32
+            
             base_model = AutoModelForSeq2SeqLM.from_pretrained(
                 base_model_name,
                 cache_dir=settings.model_cache_dir,
-                dtype=torch.float16 if self.device == "cuda" else torch.float32
+                dtype=dtype
             )
             
             # Load LoRA adapters if they exist
@@ -78,6 +85,19 @@ class TranslationService:
             logger.error(f"Error loading model: {e}")
             raise
     
+    def compile(self):
+        """Compile the model's forward pass with torch.compile (CUDA only)."""
+        if self.device != "cuda":
+            logger.warning("torch.compile is only used on CUDA, skipping")
+            return
+        # PeftModel.generate delegates to the underlying model, which calls its
+        # own forward, so that's the one to compile (the LoRA layers are
+        # injected into it). generate() calls it every decoding step.
+        # Default mode, not CUDA graphs: generation input shapes vary.
+        model = self.model.get_base_model() if isinstance(self.model, PeftModel) else self.model
+        model.forward = torch.compile(model.forward, dynamic=True)
+        logger.info("Compiled model forward with torch.compile")
+    
     def translate(self, text: str, max_length: int = 256, use_style_memory: bool = True) -> str:
         """Translate English text to Azerbaijani with optional style memory integration."""
         if not self.model or not self.tokenizer:
@@ -195,19 +215,9 @@ class TranslationService:
             
             # Decode with target language context
             self.tokenizer.tgt_lang = "azj_Latn"  # Correct Azerbaijani language code
-            translation = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Clean up translation - remove language codes and prefixes
-            translation = translation.replace("azj_Latn", "").replace("aze_Latn", "").replace("eng_Latn", "").strip()
-            # Remove "azj" or "aze" prefixes if they appear at the start
-            translation = re.sub(r'^(azj|aze)\s*,?\s*', '', translation, flags=re.IGNORECASE).strip()
-            if translation.lower().startswith("azj "):
-                translation = translation[4:].strip()
-            if translation.lower().startswith("azj,"):
-                translation = translation[4:].strip()
-            if translation.lower().startswith("azee"):
-                # Sometimes produces "azee" or "azees" - remove it
-                translation = re.sub(r'^azee?s?\s*,?\s*', '', translation, flags=re.IGNORECASE).strip()
+            translation = self._clean_translation(
+                self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            )
             
             # Verify translation is different from input
             if translation.strip().lower() == text.strip().lower() or not translation:
@@ -226,6 +236,20 @@ class TranslationService:
                 logger.warning(f"Translation failed for: {text[:50]}..., returning original text")
                 return f"[Translation Error] {text}"
     
+    def _clean_translation(self, translation: str) -> str:
+        """Remove language codes and prefixes the model sometimes emits."""
+        translation = translation.replace("azj_Latn", "").replace("aze_Latn", "").replace("eng_Latn", "").strip()
+        # Remove "azj" or "aze" prefixes if they appear at the start
+        translation = re.sub(r'^(azj|aze)\s*,?\s*', '', translation, flags=re.IGNORECASE).strip()
+        if translation.lower().startswith("azj "):
+            translation = translation[4:].strip()
+        if translation.lower().startswith("azj,"):
+            translation = translation[4:].strip()
+        if translation.lower().startswith("azee"):
+            # Sometimes produces "azee" or "azees" - remove it
+            translation = re.sub(r'^azee?s?\s*,?\s*', '', translation, flags=re.IGNORECASE).strip()
+        return translation
+    
     def _translate_simple(self, text: str, max_length: int = 256) -> str:
         """Simple translation fallback method."""
         self.tokenizer.src_lang = "eng_Latn"
@@ -251,11 +275,85 @@ class TranslationService:
         translation = translation.replace("azj_Latn", "").replace("aze_Latn", "").replace("eng_Latn", "").strip()
         return translation if translation else f"[Translation Error] {text}"
     
-    def translate_batch(self, texts: list, max_length: int = 256) -> list:
-        """Translate a batch of texts."""
-        translations = []
-        for text in texts:
-            translations.append(self.translate(text, max_length))
+    def translate_batch(
+        self,
+        texts: List[str],
+        max_length: int = 256,
+        use_style_memory: bool = True,
+        batch_size: int = 32
+    ) -> List[str]:
+        """
+        Translate a batch of texts.
+        
+        Texts are padded together and translated with one generate call per
+        batch_size texts. Texts with a near-exact style memory match use it directly.
+        """
+        if not self.model or not self.tokenizer:
+            raise RuntimeError("Model not loaded")
+        
+        translations: List[Optional[str]] = [None] * len(texts)
+        
+        # Style memory first, as in translate()
+        if use_style_memory:
+            try:
+                from backend.services.style_memory import get_style_memory_service
+                style_memory_service = get_style_memory_service()
+                for idx, text in enumerate(texts):
+                    nearest = style_memory_service.find_nearest(text, k=1, threshold=0.95)
+                    if nearest:
+                        translations[idx] = nearest[0][0]["preferred_az"]
+            except Exception as e:
+                logger.warning(f"Error checking style memory: {e}, falling back to model translation")
+        
+        pending = [idx for idx, translation in enumerate(translations) if translation is None]
+        
+        self.tokenizer.src_lang = "eng_Latn"
+        self.tokenizer.tgt_lang = "azj_Latn"
+        azj_token_id = self.tokenizer.convert_tokens_to_ids("azj_Latn")
+        
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            batch_texts = [texts[idx] for idx in batch]
+            try:
+                inputs = self.tokenizer(
+                    batch_texts,
+                    return_tensors="pt",
+                    max_length=max_length,
+                    truncation=True,
+                    padding=True
+                ).to(self.device)
+                
+                generate_kwargs = {
+                    **inputs,
+                    "max_length": max_length,
+                    "num_beams": 4,
+                    "early_stopping": True,
+                }
+                if azj_token_id is not None and azj_token_id != self.tokenizer.unk_token_id:
+                    generate_kwargs["forced_bos_token_id"] = azj_token_id
+                
+                with torch.inference_mode():
+                    outputs = self.model.generate(**generate_kwargs)
+                
+                decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            except Exception as e:
+                logger.error(f"Error during batch translation, translating one by one: {e}", exc_info=True)
+                for idx in batch:
+                    translations[idx] = self.translate(texts[idx], max_length, use_style_memory=False)
+                continue
+            
+            for idx, text, translation in zip(batch, batch_texts, decoded):
+                translation = self._clean_translation(translation)
+                if translation.strip().lower() == text.strip().lower() or not translation:
+                    logger.error(f"Translation failed - output same as input or empty: {text[:50]}... -> {translation[:50]}")
+                    # One failing text must not fail the rest of the batch
+                    try:
+                        translation = self._translate_simple(text, max_length)
+                    except Exception as e:
+                        logger.warning(f"Translation failed for: {text[:50]}..., returning original text ({e})")
+                        translation = f"[Translation Error] {text}"
+                translations[idx] = translation
+        
         return translations
 
 
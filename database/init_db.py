@@ -76,10 +76,51 @@ def init_database():
             conn.rollback()
             raise
     
+    # Schema changes to existing tables, which CREATE ... IF NOT EXISTS skips
+    upgrade_schema(conn)
+    
     cursor.close()
     conn.close()
 
 
+def upgrade_schema(conn):
+    """Apply schema changes that schema.sql can't make to existing databases."""
+    cursor = conn.cursor()
+    try:
+        # One style memory entry per segment (style_memory_service relies on
+        # ON CONFLICT (segment_id)). Drop duplicates first, keeping the newest.
+        cursor.execute("""
+            SELECT 1 FROM pg_constraint
+            WHERE conname = 'style_memory_segment_id_key'
+        """)
+        if not cursor.fetchone():
+            cursor.execute("""
+                DELETE FROM style_memory sm
+                USING style_memory newer
+                WHERE sm.segment_id = newer.segment_id
+                  AND sm.id < newer.id
+            """)
+            print(f"Deleted {cursor.rowcount} duplicate style memory entries.")
+            cursor.execute("""
+                ALTER TABLE style_memory
+                ADD CONSTRAINT style_memory_segment_id_key UNIQUE (segment_id)
+            """)
+            print("Added UNIQUE(segment_id) to style_memory.")
+        
+        # Latest override per segment lookups (retrain_with_all_data export)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_overrides_segment_created
+            ON overrides(segment_id, created_at DESC)
+        """)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
 if __name__ == "__main__":
     init_database()
 
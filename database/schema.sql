@@ -55,7 +55,7 @@ CREATE INDEX IF NOT EXISTS idx_segments_from_style_memory ON segments(from_style
 -- Style memory table (approved overrides with embeddings)
 CREATE TABLE IF NOT EXISTS style_memory (
     id SERIAL PRIMARY KEY,
-    segment_id INTEGER REFERENCES segments(id) ON DELETE SET NULL,
+    segment_id INTEGER UNIQUE REFERENCES segments(id) ON DELETE SET NULL, -- one entry per segment
     source_en TEXT NOT NULL,
     preferred_az TEXT NOT NULL,
     embedding vector(384), -- Sentence transformer embedding dimension (paraphrase-multilingual-MiniLM-L12-v2)
@@ -68,8 +68,8 @@ CREATE TABLE IF NOT EXISTS style_memory (
 
 -- Create index for vector similarity search
 CREATE INDEX IF NOT EXISTS idx_style_memory_embedding 
-ON style_memory USING ivfflat (embedding vector_cosine_ops)
-WITH (lists = 100);
+ON style_memory USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
 
 CREATE INDEX IF NOT EXISTS idx_style_memory_source ON style_memory(source_en);
 
@@ -88,6 +88,7 @@ CREATE TABLE IF NOT EXISTS overrides (
 CREATE INDEX IF NOT EXISTS idx_overrides_segment_id ON overrides(segment_id);
 CREATE INDEX IF NOT EXISTS idx_overrides_user_id ON overrides(user_id);
 CREATE INDEX IF NOT EXISTS idx_overrides_created_at ON overrides(created_at);
+CREATE INDEX IF NOT EXISTS idx_overrides_segment_created ON overrides(segment_id, created_at DESC); -- latest override per segment
 
 -- Training runs table (track model versions)
 CREATE TABLE IF NOT EXISTS training_runs (
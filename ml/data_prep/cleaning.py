@@ -31,8 +31,22 @@ def normalize_azerbaijani(text: str) -> str:
     return text
 
 
-def sentence_tokenize(text: str, language: str = 'en') -> List[str]:
-    """Tokenize text into sentences with improved splitting."""
+# NLTK Punkt model names for the language codes used in the pipeline.
+# Azerbaijani has no Punkt model and uses the regex splitter below.
+PUNKT_LANGUAGES = {
+    'en': 'english',
+}
+
+# Split on sentence endings followed by whitespace and an uppercase letter
+SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[.!?…])\s+(?=[A-ZÇƏĞİÖŞÜ])')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Loaded Punkt tokenizers by language code (None if unavailable)
+_punkt_tokenizers = {}
+
+
+def _load_punkt_tokenizer(punkt_language: str):
+    """Load a Punkt sentence tokenizer, downloading NLTK data if needed."""
     import nltk
     import ssl
     
@@ -44,38 +58,63 @@ def sentence_tokenize(text: str, language: str = 'en') -> List[str]:
     else:
         ssl._create_default_https_context = _create_unverified_https_context
     
-    # Download required NLTK data
     try:
-        nltk.data.find(f'tokenizers/punkt_tab/{language}/')
-    except LookupError:
+        # NLTK >= 3.9 ships Punkt parameters as punkt_tab
+        from nltk.tokenize import PunktTokenizer
+    except ImportError:
+        PunktTokenizer = None
+    
+    if PunktTokenizer is not None:
         try:
+            nltk.data.find(f'tokenizers/punkt_tab/{punkt_language}/')
+        except LookupError:
             nltk.download('punkt_tab', quiet=True)
-        except:
-            # Fallback to old punkt
+        return PunktTokenizer(punkt_language)
+    
+    # Fallback to old punkt pickles
+    try:
+        nltk.data.find(f'tokenizers/punkt/{punkt_language}.pickle')
+    except LookupError:
+        nltk.download('punkt', quiet=True)
+    return nltk.data.load(f'tokenizers/punkt/{punkt_language}.pickle')
+
+
+def get_punkt_tokenizer(language: str):
+    """Get the cached Punkt tokenizer for a language, or None if there isn't one."""
+    if language not in _punkt_tokenizers:
+        tokenizer = None
+        punkt_language = PUNKT_LANGUAGES.get(language)
+        if punkt_language:
             try:
-                nltk.download('punkt', quiet=True)
-            except:
-                pass
+                tokenizer = _load_punkt_tokenizer(punkt_language)
+            except Exception:
+                tokenizer = None
+        _punkt_tokenizers[language] = tokenizer
+    return _punkt_tokenizers[language]
+
+
+def sentence_tokenize(text: str, language: str = 'en') -> List[str]:
+    """Tokenize text into sentences with improved splitting."""
+    tokenizer = get_punkt_tokenizer(language)
     
-    from nltk.tokenize import sent_tokenize
+    sentences = None
+    if tokenizer is not None:
+        try:
+            # Use NLTK sentence tokenizer
+            sentences = tokenizer.tokenize(text)
+        except Exception:
+            sentences = None
     
-    try:
-        # Use NLTK sentence tokenizer
-        sentences = sent_tokenize(text, language=language)
-    except:
-        # Fallback: improved regex-based sentence splitting
-        import re
-        # Split on sentence endings (. ! ?) followed by whitespace or newline
-        # Handle abbreviations and decimal numbers
-        pattern = r'(?<=[.!?])\s+(?=[A-Z])'
-        sentences = re.split(pattern, text)
+    if sentences is None:
+        # Fallback: regex-based sentence splitting
+        sentences = SENTENCE_BOUNDARY_PATTERN.split(text)
     
     # Clean and filter sentences
     cleaned_sentences = []
     for sent in sentences:
         sent = sent.strip()
         # Remove extra whitespace
-        sent = re.sub(r'\s+', ' ', sent)
+        sent = WHITESPACE_PATTERN.sub(' ', sent)
         
         # Only include sentences that are:
         # - At least 10 characters
@@ -1,11 +1,15 @@
 """Main data preparation pipeline."""
-import json
 import os
 import sys
 import logging
 from pathlib import Path
 from typing import List, Tuple, Optional
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+import orjson
 
 # Add project root to path
 project_root = Path(__file__).parent.parent.parent
@@ -37,6 +41,21 @@ def process_book_pair(
     source_text = extract_text(source_file)
     target_text = extract_text(target_file)
     
+    return process_book_texts(source_text, target_text, book_id, alignment_method)
+
+
+def process_book_texts(
+    source_text: Optional[str],
+    target_text: Optional[str],
+    book_id: str,
+    alignment_method: str = 'simple'
+) -> List[dict]:
+    """
+    Clean, tokenize and align already extracted source and target texts.
+    
+    Returns:
+        List of dictionaries with 'id', 'en', 'az' keys
+    """
     if not source_text or not target_text:
         logger.error(f"Failed to extract text from files")
         return []
@@ -81,13 +100,26 @@ def save_jsonl(entries: List[dict], output_path: str):
     """Save entries to JSONL file."""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with open(output_path, 'wb') as f:
         for entry in entries:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.write(orjson.dumps(entry) + b'\n')
     
     logger.info(f"Saved {len(entries)} entries to {output_path}")
 
 
+def write_lines_at_offsets(source_path: str, offsets: np.ndarray, output_path: str):
+    """Copy the lines starting at the given byte offsets of a file into a new file."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    with open(source_path, 'rb') as src, open(output_path, 'wb') as dst:
+        for offset in offsets:
+            src.seek(int(offset))
+            line = src.readline()
+            dst.write(line if line.endswith(b'\n') else line + b'\n')
+    
+    logger.info(f"Saved {len(offsets)} entries to {output_path}")
+
+
 def split_dataset(
     jsonl_path: str,
     train_ratio: float = 0.8,
@@ -95,39 +127,44 @@ def split_dataset(
     test_ratio: float = 0.1
 ):
     """Split JSONL dataset into train/val/test."""
-    # Read all entries
-    entries = []
-    with open(jsonl_path, 'r', encoding='utf-8') as f:
+    # Index the byte offset of every non-empty line instead of loading entries
+    offsets = []
+    with open(jsonl_path, 'rb') as f:
+        position = 0
         for line in f:
-            entries.append(json.loads(line.strip()))
+            if line.strip():
+                offsets.append(position)
+            position += len(line)
+    offsets = np.asarray(offsets, dtype=np.int64)
     
     # Shuffle
-    import random
-    random.seed(42)
-    random.shuffle(entries)
+    offsets = offsets[np.random.default_rng(42).permutation(len(offsets))]
     
     # Calculate splits
-    total = len(entries)
+    total = len(offsets)
     train_end = int(total * train_ratio)
     val_end = train_end + int(total * val_ratio)
     
-    train_entries = entries[:train_end]
-    val_entries = entries[train_end:val_end]
-    test_entries = entries[val_end:]
+    train_offsets = offsets[:train_end]
+    val_offsets = offsets[train_end:val_end]
+    test_offsets = offsets[val_end:]
     
     # Save splits
     base_path = os.path.splitext(jsonl_path)[0]
-    save_jsonl(train_entries, f"{base_path}_train.jsonl")
-    save_jsonl(val_entries, f"{base_path}_val.jsonl")
-    save_jsonl(test_entries, f"{base_path}_test.jsonl")
+    write_lines_at_offsets(jsonl_path, train_offsets, f"{base_path}_train.jsonl")
+    write_lines_at_offsets(jsonl_path, val_offsets, f"{base_path}_val.jsonl")
+    write_lines_at_offsets(jsonl_path, test_offsets, f"{base_path}_test.jsonl")
     
-    logger.info(f"Split dataset: train={len(train_entries)}, val={len(val_entries)}, test={len(test_entries)}")
+    logger.info(f"Split dataset: train={len(train_offsets)}, val={len(val_offsets)}, test={len(test_offsets)}")
 
 
 def process_directory(
     input_dir: str,
     output_dir: str,
-    alignment_method: str = 'simple'
+    alignment_method: str = 'simple',
+    io_workers: int = 4,
+    cpu_workers: Optional[int] = None,
+    prefetch: int = 8
 ):
     """
     Process all book pairs in a directory.
@@ -160,20 +197,53 @@ def process_directory(
                     source_files[book_id] = {}
                 source_files[book_id]['target'] = str(file)
     
-    # Process each book pair
-    all_entries = []
+    book_pairs = []
     for book_id, files in source_files.items():
         if 'source' in files and 'target' in files:
-            entries = process_book_pair(
-                files['source'],
-                files['target'],
-                book_id,
-                alignment_method
-            )
-            all_entries.extend(entries)
+            book_pairs.append((book_id, files['source'], files['target']))
         else:
             logger.warning(f"Incomplete pair for book {book_id}")
     
+    # Process each book pair. Extraction (I/O) runs in a thread pool and is
+    # prefetched a few books ahead, while cleaning/tokenizing/alignment (CPU)
+    # runs in a process pool, so reading book N+1 overlaps processing book N.
+    all_entries = []
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=cpu_workers) as cpu_pool:
+        pending_extractions = deque()
+        cpu_futures = []
+        remaining = iter(book_pairs)
+        
+        def schedule_extraction():
+            pair = next(remaining, None)
+            if pair is None:
+                return
+            book_id, source_file, target_file = pair
+            logger.info(f"Processing book pair: {source_file} -> {target_file}")
+            pending_extractions.append((
+                book_id,
+                io_pool.submit(extract_text, source_file),
+                io_pool.submit(extract_text, target_file)
+            ))
+        
+        for _ in range(prefetch):
+            schedule_extraction()
+        
+        while pending_extractions:
+            book_id, source_future, target_future = pending_extractions.popleft()
+            cpu_futures.append(cpu_pool.submit(
+                process_book_texts,
+                source_future.result(),
+                target_future.result(),
+                book_id,
+                alignment_method
+            ))
+            schedule_extraction()
+        
+        # Collect in submission order so the combined file is deterministic
+        for future in cpu_futures:
+            all_entries.extend(future.result())
+    
     # Save combined JSONL
     combined_path = output_path / "combined.jsonl"
     save_jsonl(all_entries, str(combined_path))
@@ -1,6 +1,9 @@
 """Inference utilities for translation with style memory integration."""
+from collections import OrderedDict
 from typing import Optional, List
+import hashlib
 import logging
+import threading
 
 from backend.services.translation import get_translation_service
 from backend.services.style_memory import get_style_memory_service
@@ -11,10 +14,47 @@ logger = logging.getLogger(__name__)
 class TranslationInference:
     """Combined inference with model and style memory."""
     
-    def __init__(self):
+    def __init__(self, cache_size: int = 10_000):
         self.translation_service = get_translation_service()
         self.style_memory_service = get_style_memory_service()
         self.style_threshold = 0.8
+        
+        # LRU cache of model translations for exact repeats of a source text.
+        # Only the model output is cached; style memory changes as overrides
+        # are approved, so it's looked up on every call.
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    @staticmethod
+    def _cache_key(source_text: str) -> str:
+        """Build a cache key from a digest of the source text."""
+        return hashlib.blake2b(source_text.strip().encode("utf-8"), digest_size=16).hexdigest()
+    
+    def clear_cache(self):
+        """Drop cached model translations, e.g. after loading a new model."""
+        with self._cache_lock:
+            self._cache.clear()
+    
+    def _model_translation(self, source_text: str) -> str:
+        """Model translation of source_text (without style memory), served from the LRU cache."""
+        key = self._cache_key(source_text)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        
+        translation = self.translation_service.translate(source_text, use_style_memory=False)
+        
+        # Don't cache failed translations so they are retried
+        if not translation.startswith("[Translation Error]"):
+            with self._cache_lock:
+                self._cache[key] = translation
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        
+        return translation
     
     def translate_with_style(
         self,
@@ -24,11 +64,14 @@ class TranslationInference:
         """
         Translate with style memory integration.
         
+        Model translations of repeated source texts are served from an LRU
+        cache; style memory is always checked against its current contents.
+        
         Returns:
             dict with 'translation', 'style_hint', 'from_style_memory'
         """
         # Get base translation
-        translation = self.translation_service.translate(source_text)
+        translation = self._model_translation(source_text)
         
         result = {
             "translation": translation,
@@ -71,7 +114,13 @@ class TranslationInference:
         return results
 
 
-def get_inference_service() -> TranslationInference:
-    """Get inference service instance."""
-    return TranslationInference()
+# Global instance
+_inference_service: Optional[TranslationInference] = None
 
+
+def get_inference_service() -> TranslationInference:
+    """Get or create inference service instance."""
+    global _inference_service
+    if _inference_service is None:
+        _inference_service = TranslationInference()
+    return _inference_service
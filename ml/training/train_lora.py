@@ -4,6 +4,8 @@ import sys
 import argparse
 import logging
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 # Add project root to path
@@ -14,6 +16,7 @@ sys.path.insert(0, str(project_root))
 warnings.filterwarnings("ignore", message=".*pin_memory.*MPS.*")
 
 import torch
+import torch.nn.functional as F
 from transformers import (
     AutoTokenizer,
     AutoModelForSeq2SeqLM,
@@ -21,7 +24,7 @@ from transformers import (
     Trainer,
     DataCollatorForSeq2Seq
 )
-from datasets import load_dataset
+from datasets import DatasetDict, load_dataset
 from peft import LoraConfig, get_peft_model, TaskType
 import numpy as np
 
@@ -29,6 +32,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def load_split(data_path: str):
+    """Load one data file, choosing the builder from its extension."""
+    builder = "parquet" if str(data_path).endswith(".parquet") else "json"
+    return load_dataset(builder, data_files=str(data_path), split="train")
+
+
 def setup_model_and_tokenizer(model_name: str, cache_dir: str = "./models"):
     """Load model and tokenizer."""
     logger.info(f"Loading model: {model_name}")
@@ -80,33 +89,65 @@ def preprocess_function(examples, tokenizer, max_length: int = 256):
     else:
         raise ValueError("Dataset must have either ('en', 'az') or ('source', 'target') columns")
     
-    # Tokenize inputs
+    # Tokenize inputs and targets in one call; targets come back as "labels".
+    # No padding here: DataCollatorForSeq2Seq pads each batch to its longest
+    # sequence and pads labels with -100 so they're ignored by the loss.
     model_inputs = tokenizer(
-        inputs,
-        max_length=max_length,
-        truncation=True,
-        padding="max_length"
-    )
-    
-    # Tokenize targets (using text_target parameter)
-    labels = tokenizer(
+        text=inputs,
         text_target=targets,
         max_length=max_length,
         truncation=True,
-        padding="max_length"
+        padding=False,
+        return_attention_mask=True,
+        return_overflowing_tokens=False
     )
     
-    model_inputs["labels"] = labels["input_ids"]
-    
-    # Replace padding token id's of the labels by -100 so it's ignored by the loss
-    model_inputs["labels"] = [
-        [(l if l != tokenizer.pad_token_id else -100) for l in label]
-        for label in model_inputs["labels"]
-    ]
+    # Sequence lengths for group_by_length batching
+    model_inputs["input_ids_length"] = [len(ids) for ids in model_inputs["input_ids"]]
     
     return model_inputs
 
 
+# Embedding model for Style Similarity, loaded once and reused across evaluations
+_embedding_model = None
+
+
+def get_embedding_model():
+    """Get or create the sentence embedding model on the available device."""
+    global _embedding_model
+    if _embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+        # Use the same embedding model as the metrics service
+        _embedding_model = SentenceTransformer(
+            'paraphrase-multilingual-MiniLM-L12-v2',
+            device='cuda' if torch.cuda.is_available() else 'cpu'
+        )
+    return _embedding_model
+
+
+@lru_cache(maxsize=1)
+def encode_references(references: tuple):
+    """Encode reference texts, cached since the validation labels don't change between epochs."""
+    return get_embedding_model().encode(list(references), convert_to_tensor=True)
+
+
+def compute_style_similarity(decoded_preds, decoded_labels) -> float:
+    """Compute Style Similarity Score (SSS) using embeddings."""
+    style_similarity = 0.0
+    try:
+        if decoded_preds and decoded_labels:
+            # Embeddings stay on the embedding model's device as tensors
+            pred_embeddings = get_embedding_model().encode(decoded_preds, convert_to_tensor=True)
+            ref_embeddings = encode_references(tuple(decoded_labels))
+            
+            similarities = F.cosine_similarity(pred_embeddings, ref_embeddings, dim=1)
+            style_similarity = similarities.mean().item()
+    except Exception as e:
+        logger.warning(f"Error calculating style similarity during training: {e}")
+    
+    return style_similarity
+
+
 def compute_metrics(eval_pred, tokenizer):
     """Compute BLEU, ChrF, and Style Similarity metrics."""
     predictions, labels = eval_pred
@@ -125,39 +166,19 @@ def compute_metrics(eval_pred, tokenizer):
     labels = np.where(labels != -100, labels, tokenizer.pad_token_id)
     decoded_labels = tokenizer.batch_decode(labels, skip_special_tokens=True)
     
-    # Calculate BLEU and ChrF
+    # BLEU, ChrF and Style Similarity are independent, so run them concurrently.
+    # The embedding forward pass releases the GIL and overlaps the sacrebleu work.
     import sacrebleu
-    bleu = sacrebleu.corpus_bleu(decoded_preds, [decoded_labels])
-    chrf = sacrebleu.corpus_chrf(decoded_preds, [decoded_labels])
-    
-    # Calculate Style Similarity Score (SSS) using embeddings
-    style_similarity = 0.0
-    try:
-        from sentence_transformers import SentenceTransformer
-        from sklearn.metrics.pairwise import cosine_similarity
-        import numpy as np
-        
-        # Use the same embedding model as the metrics service
-        embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        bleu_future = executor.submit(sacrebleu.corpus_bleu, decoded_preds, [decoded_labels])
+        chrf_future = executor.submit(sacrebleu.corpus_chrf, decoded_preds, [decoded_labels])
+        style_future = executor.submit(compute_style_similarity, decoded_preds, decoded_labels)
         
-        if decoded_preds and decoded_labels:
-            pred_embeddings = embedding_model.encode(decoded_preds)
-            ref_embeddings = embedding_model.encode(decoded_labels)
-            
-            similarities = []
-            for pred_emb, ref_emb in zip(pred_embeddings, ref_embeddings):
-                similarity = cosine_similarity([pred_emb], [ref_emb])[0][0]
-                similarities.append(similarity)
-            
-            style_similarity = float(np.mean(similarities))
-    except Exception as e:
-        logger.warning(f"Error calculating style similarity during training: {e}")
-    
-    return {
-        "bleu": bleu.score,
-        "chrf": chrf.score,
-        "style_similarity": style_similarity
-    }
+        return {
+            "bleu": bleu_future.result().score,
+            "chrf": chrf_future.result().score,
+            "style_similarity": style_future.result()
+        }
 
 
 def train(
@@ -183,15 +204,13 @@ def train(
     # Setup LoRA
     model = setup_lora(model, r=lora_r, lora_alpha=lora_alpha)
     
-    # Load dataset
+    # Load dataset (Parquet is memory-mapped; JSONL is parsed into the Arrow cache)
     logger.info(f"Loading dataset from {train_data_path}")
-    dataset = load_dataset(
-        "json",
-        data_files={
-            "train": train_data_path,
-            "validation": val_data_path
-        }
-    )
+    # Each split picks its own builder, so the two files may use different formats
+    dataset = DatasetDict({
+        "train": load_split(train_data_path),
+        "validation": load_split(val_data_path)
+    })
     
     # Preprocess
     logger.info("Preprocessing dataset")
@@ -212,6 +231,9 @@ def train(
     # Disable pin_memory for MPS (Apple Silicon) to avoid warnings
     use_pin_memory = torch.cuda.is_available() and not torch.backends.mps.is_available()
     
+    # torch.compile and the fused AdamW kernel are only used on CUDA
+    use_cuda_optimizations = torch.cuda.is_available()
+    
     training_args = TrainingArguments(
         output_dir=output_dir,
         per_device_train_batch_size=batch_size,
@@ -228,6 +250,11 @@ def train(
         save_total_limit=3,
         fp16=torch.cuda.is_available(),
         dataloader_pin_memory=use_pin_memory,  # Disable for MPS
+        torch_compile=use_cuda_optimizations,
+        torch_compile_backend="inductor" if use_cuda_optimizations else None,
+        optim="adamw_torch_fused" if use_cuda_optimizations else "adamw_torch",
+        group_by_length=True,  # Batch similar-length sequences to cut padding
+        length_column_name="input_ids_length",
         push_to_hub=False,
         report_to="none"
     )
@@ -290,8 +317,8 @@ def train(
 
 def main():
     parser = argparse.ArgumentParser(description="Train NLLB-200 with LoRA")
-    parser.add_argument("--train-data", required=True, help="Path to train JSONL file")
-    parser.add_argument("--val-data", required=True, help="Path to validation JSONL file")
+    parser.add_argument("--train-data", required=True, help="Path to train JSONL or Parquet file")
+    parser.add_argument("--val-data", required=True, help="Path to validation JSONL or Parquet file")
     parser.add_argument("--output-dir", required=True, help="Output directory for model")
     parser.add_argument("--model-name", default="facebook/nllb-200-distilled-1.3B",
                        help="Model name or path")
@@ -7,7 +7,9 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from backend.models.database import SessionLocal, Segment, TrainingRun
-from backend.api.segments import calculate_and_store_segment_metrics
+from backend.api.segments import (
+    calculate_and_store_segment_metrics, segment_metrics_row, bulk_update_segment_metrics
+)
 from backend.services.metrics import get_metrics_service
 import logging
 
@@ -15,32 +17,68 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Segments loaded and flushed per batch, and how often to commit
+BATCH_SIZE = 500
+COMMIT_EVERY = 5000
+
+
 def calculate_segment_metrics():
     """Calculate metrics for all segments."""
     db = SessionLocal()
     try:
-        segments = db.query(Segment).filter(
-            Segment.translated_az.isnot(None),
-            Segment.translated_az != ""
-        ).all()
+        # Only fetch ids up front; segments are loaded a batch at a time
+        segment_ids = [
+            segment_id for (segment_id,) in db.query(Segment.id).filter(
+                Segment.translated_az.isnot(None),
+                Segment.translated_az != ""
+            ).order_by(Segment.id)
+        ]
         
-        print(f"Found {len(segments)} segments with translations")
+        print(f"Found {len(segment_ids)} segments with translations")
         
         calculated = 0
-        for idx, segment in enumerate(segments):
+        for start in range(0, len(segment_ids), BATCH_SIZE):
+            batch_ids = segment_ids[start:start + BATCH_SIZE]
+            segments = db.query(Segment).filter(Segment.id.in_(batch_ids)).all()
+            
+            rows = []
+            for segment in segments:
+                # A savepoint per segment, so a failing one only loses itself
+                savepoint = db.begin_nested()
+                try:
+                    calculate_and_store_segment_metrics(segment, db, flush=False)
+                    rows.append(segment_metrics_row(segment))
+                    # Metrics are written in bulk below, so the ORM must not flush this segment
+                    db.expunge(segment)
+                    savepoint.commit()
+                except Exception as e:
+                    logger.warning(f"Error calculating metrics for segment {segment.id}: {e}")
+                    savepoint.rollback()
+                    if segment in db:
+                        db.expunge(segment)
+            
+            # Write the whole batch with one bulk UPDATE in its own savepoint
+            savepoint = db.begin_nested()
             try:
-                calculate_and_store_segment_metrics(segment, db)
-                calculated += 1
-                
-                if (idx + 1) % 50 == 0:
-                    db.commit()
-                    print(f"  Calculated metrics for {idx + 1}/{len(segments)} segments...")
+                cursor = db.connection().connection.cursor()
+                try:
+                    bulk_update_segment_metrics(cursor, rows)
+                finally:
+                    cursor.close()
+                savepoint.commit()
+                calculated += len(rows)
             except Exception as e:
-                logger.warning(f"Error calculating metrics for segment {segment.id}: {e}")
-                db.rollback()
+                logger.warning(f"Error writing metrics for segments {batch_ids[0]}-{batch_ids[-1]}: {e}")
+                savepoint.rollback()
+            db.expunge_all()
+            
+            processed = start + len(batch_ids)
+            if processed % COMMIT_EVERY == 0:
+                db.commit()
+            print(f"  Calculated metrics for {processed}/{len(segment_ids)} segments...")
         
         db.commit()
-        print(f"✓ Calculated metrics for {calculated}/{len(segments)} segments")
+        print(f"✓ Calculated metrics for {calculated}/{len(segment_ids)} segments")
     
     finally:
         db.close()
@@ -12,16 +12,16 @@ from config.settings import settings
 
 def fix_embedding_dimension():
     """Fix the embedding dimension in the database."""
+    conn = psycopg2.connect(
+        host=settings.postgres_host,
+        port=settings.postgres_port,
+        user=settings.postgres_user,
+        password=settings.postgres_password,
+        database=settings.postgres_db
+    )
+    cursor = conn.cursor()
+    
     try:
-        conn = psycopg2.connect(
-            host=settings.postgres_host,
-            port=settings.postgres_port,
-            user=settings.postgres_user,
-            password=settings.postgres_password,
-            database=settings.postgres_db
-        )
-        cursor = conn.cursor()
-        
         print("Fixing embedding dimension from 768 to 384...")
         
         # Check if table has data
@@ -48,15 +48,22 @@ def fix_embedding_dimension():
         print("Altering embedding column to 384 dimensions...")
         cursor.execute("ALTER TABLE style_memory ALTER COLUMN embedding TYPE vector(384)")
         
-        # Recreate the index
-        print("Recreating index...")
+        conn.commit()
+        
+        # Recreate the index as HNSW. CREATE INDEX CONCURRENTLY can't run inside
+        # a transaction block, so switch to autocommit for this statement. This
+        # avoids holding an exclusive lock on style_memory while the index builds.
+        # A failed concurrent build from an earlier run leaves an INVALID index
+        # that IF NOT EXISTS would skip, so drop any leftover first.
+        print("Recreating index (HNSW, concurrently)...")
+        conn.autocommit = True
+        cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_style_memory_embedding")
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_style_memory_embedding 
-            ON style_memory USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = 100)
+            CREATE INDEX CONCURRENTLY idx_style_memory_embedding 
+            ON style_memory USING hnsw (embedding vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64)
         """)
         
-        conn.commit()
         print("✓ Embedding dimension fixed successfully!")
         
     except Exception as e:
@@ -1,10 +1,11 @@
 """Generate additional sample training data."""
-import json
 import os
+import numpy as np
+import orjson
 from pathlib import Path
 
-# Sample English-Azerbaijani translation pairs
-sample_pairs = [
+# Sample English-Azerbaijani translation pairs (immutable; splits index into it)
+sample_pairs = (
     ("The cat sat on the mat.", "Pişik xalça üzərində oturdu."),
     ("She loves reading books in the evening.", "O, axşam kitab oxumağı sevir."),
     ("The weather is beautiful today.", "Bu gün hava gözəldir."),
@@ -55,26 +56,56 @@ sample_pairs = [
     ("The road leads to the ancient castle.", "Yol qədim qalaya aparır."),
     ("We should appreciate what we have.", "Biz nəyə sahib olduğumuzu qiymətləndirməliyik."),
     ("The concert was attended by many people.", "Konsertə çoxlu insan qatıldı."),
-]
+)
 
 
-def generate_jsonl(output_path: str, pairs: list):
-    """Generate JSONL file from translation pairs."""
+def generate_jsonl(output_path: str, pairs, indices=None):
+    """Generate JSONL file from translation pairs, optionally only those at the given indices."""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for idx, (en, az) in enumerate(pairs):
-            entry = {
-                "id": f"sample_{idx:04d}",
-                "en": en,
-                "az": az
-            }
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    selected = pairs if indices is None else (pairs[i] for i in indices)
     
-    print(f"Generated {len(pairs)} translation pairs in {output_path}")
+    # Build the whole file in memory and write it with a single call
+    buf = bytearray()
+    count = 0
+    for idx, (en, az) in enumerate(selected):
+        entry = {
+            "id": f"sample_{idx:04d}",
+            "en": en,
+            "az": az
+        }
+        buf += orjson.dumps(entry)
+        buf += b"\n"
+        count += 1
+    
+    with open(output_path, 'wb') as f:
+        f.write(buf)
+    
+    print(f"Generated {count} translation pairs in {output_path}")
+
+
+def generate_parquet(output_path: str, pairs, indices=None):
+    """Generate a Parquet file from translation pairs, optionally only those at the given indices."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    selected = pairs if indices is None else (pairs[i] for i in indices)
+    
+    ids, en_col, az_col = [], [], []
+    for idx, (en, az) in enumerate(selected):
+        ids.append(f"sample_{idx:04d}")
+        en_col.append(en)
+        az_col.append(az)
+    
+    table = pa.table({"id": ids, "en": en_col, "az": az_col})
+    pq.write_table(table, output_path, compression="zstd")
+    
+    print(f"Generated {len(ids)} translation pairs in {output_path}")
 
 
-def main():
+def main(output_format: str = "parquet"):
     # Create data directories
     data_dir = Path("data")
     raw_dir = data_dir / "raw"
@@ -83,34 +114,39 @@ def main():
     raw_dir.mkdir(parents=True, exist_ok=True)
     processed_dir.mkdir(parents=True, exist_ok=True)
     
-    # Generate JSONL directly for quick training
-    jsonl_path = processed_dir / "sample_data.jsonl"
-    generate_jsonl(str(jsonl_path), sample_pairs)
+    # Parquet by default; JSONL is kept for debugging
+    generate = generate_jsonl if output_format == "jsonl" else generate_parquet
+    
+    # Generate data directly for quick training
+    generate(str(processed_dir / f"sample_data.{output_format}"), sample_pairs)
     
-    # Also create train/val/test splits
-    import random
-    random.seed(42)
-    shuffled = sample_pairs.copy()
-    random.shuffle(shuffled)
+    # Also create train/val/test splits by shuffling indices, not the pairs
+    indices = np.random.default_rng(42).permutation(len(sample_pairs))
     
-    train_end = int(len(shuffled) * 0.8)
-    val_end = train_end + int(len(shuffled) * 0.1)
+    train_end = int(len(indices) * 0.8)
+    val_end = train_end + int(len(indices) * 0.1)
     
-    train_pairs = shuffled[:train_end]
-    val_pairs = shuffled[train_end:val_end]
-    test_pairs = shuffled[val_end:]
+    train_indices = indices[:train_end]
+    val_indices = indices[train_end:val_end]
+    test_indices = indices[val_end:]
     
-    generate_jsonl(str(processed_dir / "sample_train.jsonl"), train_pairs)
-    generate_jsonl(str(processed_dir / "sample_val.jsonl"), val_pairs)
-    generate_jsonl(str(processed_dir / "sample_test.jsonl"), test_pairs)
+    generate(str(processed_dir / f"sample_train.{output_format}"), sample_pairs, train_indices)
+    generate(str(processed_dir / f"sample_val.{output_format}"), sample_pairs, val_indices)
+    generate(str(processed_dir / f"sample_test.{output_format}"), sample_pairs, test_indices)
     
     print(f"\nGenerated training data:")
-    print(f"  Train: {len(train_pairs)} pairs")
-    print(f"  Val: {len(val_pairs)} pairs")
-    print(f"  Test: {len(test_pairs)} pairs")
+    print(f"  Train: {len(train_indices)} pairs")
+    print(f"  Val: {len(val_indices)} pairs")
+    print(f"  Test: {len(test_indices)} pairs")
     print(f"\nFiles created in: {processed_dir}")
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", default="parquet", choices=["parquet", "jsonl"],
+                        help="Output file format (jsonl for debugging)")
+    args = parser.parse_args()
+    
+    main(args.format)
 
@@ -7,9 +7,15 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 import psycopg2
+from tqdm import tqdm
 from config.settings import settings
 from backend.models.database import SessionLocal, Segment
-from backend.api.segments import calculate_and_store_segment_metrics
+from backend.api.segments import (
+    calculate_and_store_segment_metrics, segment_metrics_row, bulk_update_segment_metrics
+)
+
+# Segments loaded and written per batch (one savepoint each)
+BATCH_SIZE = 500
 
 def run_migration():
     """Run migration to add metrics columns and calculate metrics."""
@@ -37,53 +43,98 @@ def run_migration():
             ADD COLUMN IF NOT EXISTS translation_source VARCHAR(50) DEFAULT 'model';
         """)
         
-        # Create indexes
-        print("Creating indexes...")
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_segments_style_similarity 
-            ON segments(style_similarity_score);
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_segments_from_style_memory 
-            ON segments(from_style_memory);
-        """)
+        # Drop the metrics indexes while every segment is rewritten; building
+        # them once afterwards is much cheaper than maintaining them per row
+        print("Dropping metrics indexes until metrics are calculated...")
+        cursor.execute("DROP INDEX IF EXISTS idx_segments_style_similarity;")
+        cursor.execute("DROP INDEX IF EXISTS idx_segments_from_style_memory;")
         
         conn.commit()
-        print("✓ Migration completed successfully!")
+        print("✓ Columns added successfully!")
         
-        # Calculate metrics for existing segments
-        print("\nCalculating metrics for existing segments...")
-        db = SessionLocal()
+        metrics_ok = False
         try:
-            segments = db.query(Segment).filter(
-                Segment.translated_az.isnot(None),
-                Segment.translated_az != ""
-            ).all()
-            
-            print(f"Found {len(segments)} segments with translations")
-            
-            for idx, segment in enumerate(segments):
-                if (idx + 1) % 10 == 0:
-                    print(f"Processing segment {idx+1}/{len(segments)}...")
-                    db.commit()  # Commit every 10 segments
+            # Calculate metrics for existing segments. The ORM session is only
+            # used to read segments and compute metrics; results are written in
+            # bulk through the migration connection in a single transaction, with
+            # a savepoint per batch so one failing batch doesn't undo the rest.
+            print("\nCalculating metrics for existing segments...")
+            db = SessionLocal()
+            try:
+                segment_ids = [
+                    segment_id for (segment_id,) in db.query(Segment.id).filter(
+                        Segment.translated_az.isnot(None),
+                        Segment.translated_az != ""
+                    ).order_by(Segment.id)
+                ]
+                
+                print(f"Found {len(segment_ids)} segments with translations")
+                
+                calculated = 0
+                progress = tqdm(total=len(segment_ids), unit="segment", mininterval=1.0)
+                for start in range(0, len(segment_ids), BATCH_SIZE):
+                    batch_ids = segment_ids[start:start + BATCH_SIZE]
+                    segments = db.query(Segment).filter(Segment.id.in_(batch_ids)).all()
+                    
+                    rows = []
+                    for segment in segments:
+                        try:
+                            calculate_and_store_segment_metrics(segment, db, flush=False)
+                            rows.append(segment_metrics_row(segment))
+                        except Exception as e:
+                            tqdm.write(f"Error calculating metrics for segment {segment.id}: {e}")
+                            db.rollback()
+                    
+                    # Discard the in-memory ORM changes; they're written below
+                    db.expunge_all()
+                    cursor.execute("SAVEPOINT metrics_batch")
+                    try:
+                        bulk_update_segment_metrics(cursor, rows)
+                        cursor.execute("RELEASE SAVEPOINT metrics_batch")
+                        calculated += len(rows)
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT metrics_batch")
+                        tqdm.write(f"Error writing metrics for segments {batch_ids[0]}-{batch_ids[-1]}: {e}")
+                    progress.update(len(batch_ids))
+                progress.close()
                 
-                try:
-                    calculate_and_store_segment_metrics(segment, db)
-                    # Commit after each calculation to ensure it's saved
-                    db.commit()
-                except Exception as e:
-                    print(f"Error calculating metrics for segment {segment.id}: {e}")
-                    db.rollback()
+                conn.commit()
+                print(f"✓ Calculated metrics for {calculated}/{len(segment_ids)} segments")
+                metrics_ok = True
             
-            # Final commit
-            db.commit()
-            print(f"✓ Calculated metrics for {len(segments)} segments")
-        
-        except Exception as e:
-            db.rollback()
-            print(f"Error calculating metrics: {e}")
+            except Exception as e:
+                conn.rollback()
+                print(f"Error calculating metrics: {e}")
+            finally:
+                db.close()
         finally:
-            db.close()
+            # Always recreate the indexes dropped above, even if calculating
+            # metrics failed or was interrupted, so segments isn't left without
+            # them. CONCURRENTLY can't run inside a transaction block, so end
+            # any open transaction and switch to autocommit. It lets other
+            # writes to segments continue while the indexes build; the metrics
+            # transaction above still held its row locks until it committed.
+            # A failed concurrent build leaves an INVALID index behind that
+            # IF NOT EXISTS would skip, so drop any leftover first.
+            print("\nCreating indexes...")
+            conn.rollback()
+            conn.autocommit = True
+            cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_segments_style_similarity;")
+            cursor.execute("""
+                CREATE INDEX CONCURRENTLY idx_segments_style_similarity 
+                ON segments(style_similarity_score);
+            """)
+            cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_segments_from_style_memory;")
+            cursor.execute("""
+                CREATE INDEX CONCURRENTLY idx_segments_from_style_memory 
+                ON segments(from_style_memory);
+            """)
+            print("✓ Indexes created")
+        
+        if metrics_ok:
+            print("✓ Migration completed successfully!")
+        else:
+            print("Migration finished with errors: metrics were not calculated. Re-run this script to retry.")
     
     except Exception as e:
         conn.rollback()
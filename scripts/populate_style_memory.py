@@ -1,53 +1,115 @@
 """Populate style memory from existing segments and training data."""
 import sys
 from pathlib import Path
+from typing import Optional
 
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from backend.models.database import SessionLocal, Segment, Override, StyleMemory
-from backend.services.style_memory import get_style_memory_service
-import json
+from backend.services.style_memory import StyleMemoryService, get_style_memory_service
+import mmap
+import orjson
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Entries embedded and inserted per batch
+OVERRIDES_BATCH_SIZE = 256
+TRAINING_DATA_BATCH_SIZE = 512
 
-def populate_from_overrides():
+
+def iter_lines(path: Path):
+    """Iterate over the raw byte lines of a file through a read-only mmap."""
+    # mmap can't map an empty file
+    if path.stat().st_size == 0:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from iter(mm.readline, b"")
+
+
+def newest_existing(*paths: Path) -> Optional[Path]:
+    """Return the most recently modified of the given paths that exist, if any."""
+    existing = [path for path in paths if path.exists()]
+    return max(existing, key=lambda path: path.stat().st_mtime) if existing else None
+
+
+def iter_training_pairs(path: Path):
+    """Iterate over (source, target) pairs of a JSONL or Parquet training file."""
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names
+        source_column, target_column = ("source", "target") if "source" in names else ("en", "az")
+        for batch in parquet_file.iter_batches(columns=[source_column, target_column]):
+            columns = batch.to_pydict()
+            yield from zip(columns[source_column], columns[target_column])
+        return
+    
+    for line in iter_lines(path):
+        if not line.strip():
+            continue
+        
+        try:
+            data = orjson.loads(line)
+            source = data.get("source") or data.get("en")
+            target = data.get("target") or data.get("az")
+        except Exception as e:
+            logger.warning(f"Error processing line: {e}")
+            continue
+        
+        yield source, target
+
+
+def populate_from_overrides(style_memory_service: StyleMemoryService):
     """Populate style memory from override records."""
     db = SessionLocal()
-    style_memory_service = get_style_memory_service()
-    
     try:
-        # Get all overrides
-        overrides = db.query(Override).all()
-        print(f"Found {len(overrides)} overrides")
+        # Overrides with their segment, for segments not yet in style memory
+        rows = db.query(Override, Segment).join(
+            Segment, Segment.id == Override.segment_id
+        ).outerjoin(
+            StyleMemory, StyleMemory.segment_id == Segment.id
+        ).filter(
+            StyleMemory.id.is_(None)
+        ).order_by(Override.id).yield_per(500)
         
         added_count = 0
-        for override in overrides:
-            segment = db.query(Segment).filter(Segment.id == override.segment_id).first()
-            if segment:
-                # Check if already in style memory
-                existing = db.query(StyleMemory).filter(
-                    StyleMemory.segment_id == segment.id
-                ).first()
-                
-                if not existing:
-                    try:
-                        style_memory_service.add_memory(
-                            source_en=segment.source_en,
-                            preferred_az=override.new_translation,
-                            segment_id=segment.id,
-                            approved_by=override.user_id,
-                            engine=override.engine
-                        )
-                        added_count += 1
-                        if added_count % 10 == 0:
-                            print(f"  Added {added_count} entries...")
-                    except Exception as e:
-                        logger.warning(f"Error adding style memory for segment {segment.id}: {e}")
+        seen_segment_ids = set()
+        batch = []
+        
+        def flush_batch():
+            nonlocal added_count
+            if not batch:
+                return
+            try:
+                memory_ids = style_memory_service.add_memory_batch(
+                    sources=[segment.source_en for _, segment in batch],
+                    targets=[override.new_translation for override, _ in batch],
+                    segment_ids=[segment.id for _, segment in batch],
+                    approved_by=[override.user_id for override, _ in batch],
+                    engines=[override.engine for override, _ in batch]
+                )
+                added_count += len(memory_ids)
+                print(f"  Added {added_count} entries...")
+            except Exception as e:
+                logger.warning(f"Error adding style memory for {len(batch)} overrides: {e}")
+            batch.clear()
+        
+        for override, segment in rows:
+            # Only the first override of a segment goes into style memory
+            if segment.id in seen_segment_ids:
+                continue
+            seen_segment_ids.add(segment.id)
+            
+            batch.append((override, segment))
+            if len(batch) >= OVERRIDES_BATCH_SIZE:
+                flush_batch()
+        
+        flush_batch()
         
         print(f"✓ Added {added_count} entries from overrides")
         return added_count
@@ -56,91 +118,92 @@ def populate_from_overrides():
         db.close()
 
 
-def populate_from_training_data():
+def populate_from_training_data(style_memory_service: StyleMemoryService):
     """Populate style memory from static training data."""
-    style_memory_service = get_style_memory_service()
-    
+    # retrain_with_all_data writes its splits as Parquet by default (JSONL
+    # with --format jsonl); for those, only the newer of the two is read so
+    # files left over from an older run aren't used instead
     training_files = [
-        "data/processed/combined_train.jsonl",
-        "data/processed/combined_val.jsonl",
-        "data/processed/retrain_combined_train.jsonl",
-        "data/processed/retrain_combined_val.jsonl"
+        Path("data/processed/combined_train.jsonl"),
+        Path("data/processed/combined_val.jsonl"),
+        newest_existing(
+            Path("data/processed/retrain_combined_train.parquet"),
+            Path("data/processed/retrain_combined_train.jsonl")
+        ),
+        newest_existing(
+            Path("data/processed/retrain_combined_val.parquet"),
+            Path("data/processed/retrain_combined_val.jsonl")
+        )
     ]
     
-    added_count = 0
-    for file_path in training_files:
-        path = Path(file_path)
-        if not path.exists():
+    # Collect unique sources across all files first; the files overlap heavily
+    # and embedding is the expensive step. The first target seen for a source wins.
+    unique = {}
+    for path in training_files:
+        if path is None or not path.exists():
             continue
         
-        print(f"Processing {file_path}...")
-        with open(path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                
-                try:
-                    data = json.loads(line)
-                    source = data.get("source") or data.get("en")
-                    target = data.get("target") or data.get("az")
-                    
-                    if source and target:
-                        # Check if already exists
-                        nearest = style_memory_service.find_nearest(source, k=1, threshold=0.99)
-                        if not nearest:
-                            style_memory_service.add_memory(
-                                source_en=source,
-                                preferred_az=target,
-                                segment_id=None,
-                                approved_by=None,
-                                engine="training_data"
-                            )
-                            added_count += 1
-                            if added_count % 50 == 0:
-                                print(f"  Added {added_count} entries...")
-                except Exception as e:
-                    logger.warning(f"Error processing line: {e}")
+        print(f"Processing {path}...")
+        for source, target in iter_training_pairs(path):
+            if source and target:
+                unique.setdefault(source, target)
+    
+    print(f"  Found {len(unique)} unique sources")
+    
+    added_count = 0
+    pairs = list(unique.items())
+    for start in range(0, len(pairs), TRAINING_DATA_BATCH_SIZE):
+        batch = pairs[start:start + TRAINING_DATA_BATCH_SIZE]
+        try:
+            # Skip entries that are (near-)duplicates of existing ones
+            memory_ids = style_memory_service.add_memory_batch(
+                [source for source, _ in batch],
+                [target for _, target in batch],
+                engines=["training_data"] * len(batch),
+                dedupe_threshold=0.99,
+                batch_size=TRAINING_DATA_BATCH_SIZE
+            )
+            added_count += len(memory_ids)
+            print(f"  Added {added_count} entries...")
+        except Exception as e:
+            logger.warning(f"Error adding batch of {len(batch)} entries: {e}")
     
     print(f"✓ Added {added_count} entries from training data")
     return added_count
 
 
-def populate_from_good_segments():
+def populate_from_good_segments(style_memory_service: StyleMemoryService):
     """Populate style memory from segments with high-quality translations."""
     db = SessionLocal()
-    style_memory_service = get_style_memory_service()
-    
     try:
-        # Get segments with translations that haven't been overridden
-        segments = db.query(Segment).filter(
+        # Get segments with translations that haven't been overridden and
+        # aren't in style memory yet (anti-join instead of a lookup per segment)
+        segments = db.query(Segment).outerjoin(
+            StyleMemory, StyleMemory.segment_id == Segment.id
+        ).filter(
             Segment.translated_az.isnot(None),
             Segment.translated_az != "",
-            Segment.has_override == False
-        ).limit(1000).all()  # Limit to avoid too many entries
+            Segment.has_override == False,
+            StyleMemory.id.is_(None)
+        ).limit(1000).yield_per(500)  # Limit to avoid too many entries
         
-        print(f"Found {len(segments)} segments with translations")
+        print("Streaming segments with translations not yet in style memory")
         
         added_count = 0
         for segment in segments:
-            # Check if already in style memory
-            existing = db.query(StyleMemory).filter(
-                StyleMemory.segment_id == segment.id
-            ).first()
-            
-            if not existing:
-                try:
-                    style_memory_service.add_memory(
-                        source_en=segment.source_en,
-                        preferred_az=segment.translated_az,
-                        segment_id=segment.id,
-                        approved_by=None,
-                        engine="model"
-                    )
-                    added_count += 1
-                    if added_count % 50 == 0:
-                        print(f"  Added {added_count} entries...")
-                except Exception as e:
-                    logger.warning(f"Error adding style memory for segment {segment.id}: {e}")
+            try:
+                style_memory_service.add_memory(
+                    source_en=segment.source_en,
+                    preferred_az=segment.translated_az,
+                    segment_id=segment.id,
+                    approved_by=None,
+                    engine="model"
+                )
+                added_count += 1
+                if added_count % 50 == 0:
+                    print(f"  Added {added_count} entries...")
+            except Exception as e:
+                logger.warning(f"Error adding style memory for segment {segment.id}: {e}")
         
         print(f"✓ Added {added_count} entries from good segments")
         return added_count
@@ -156,17 +219,20 @@ if __name__ == "__main__":
     
     total = 0
     
+    # One service (embedding model + DB connection) shared by all three steps
+    style_memory_service = get_style_memory_service()
+    
     # 1. From overrides (highest priority - these are editor-approved)
     print("\n1. Populating from overrides...")
-    total += populate_from_overrides()
+    total += populate_from_overrides(style_memory_service)
     
     # 2. From training data (good quality parallel corpus)
     print("\n2. Populating from training data...")
-    total += populate_from_training_data()
+    total += populate_from_training_data(style_memory_service)
     
     # 3. From good segments (model translations that haven't been overridden)
     print("\n3. Populating from good segments...")
-    total += populate_from_good_segments()
+    total += populate_from_good_segments(style_memory_service)
     
     print("\n" + "=" * 60)
     print(f"✓ Total entries added to style memory: {total}")
@@ -1,51 +1,251 @@
 """Recalculate metrics for all segments to populate style_similarity_score."""
+import math
+import multiprocessing
+import os
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
 
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from backend.models.database import SessionLocal, Segment
-from backend.api.segments import calculate_and_store_segment_metrics
+from backend.api.segments import (
+    calculate_and_store_segment_metrics, segment_metrics_row, bulk_update_segment_metrics
+)
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Segments written per bulk UPDATE
+BATCH_SIZE = 1000
+
+# Sources encoded per chunk when precomputing embeddings
+EMBEDDING_CHUNK_SIZE = 4096
+
+# Default cap on worker processes. Each worker loads two SentenceTransformer
+# models (metrics + style memory) and a CUDA context if a GPU is present.
+DEFAULT_MAX_WORKERS = 4
+
+
+def write_metrics(db, rows):
+    """Bulk-update segment metrics on the session's connection and commit."""
+    cursor = db.connection().connection.cursor()
+    try:
+        bulk_update_segment_metrics(cursor, rows)
+    finally:
+        cursor.close()
+    db.commit()
+
+
+def precompute_segment_embeddings(db, output_dir: str, total: int) -> Tuple[str, str]:
+    """
+    Encode source_en of every translated segment in large batches.
+    
+    Sources are streamed from the database in chunks of EMBEDDING_CHUNK_SIZE,
+    so only one chunk is held in memory at a time. Writes a float32 (N, dim)
+    memmap-able embeddings.npy and a sidecar ids.npy holding the segment id of
+    each row, sorted ascending.
+    
+    Args:
+        total: Number of translated segments, used to size the memmap
+    
+    Returns:
+        (embeddings_path, ids_path)
+    """
+    from backend.services.style_memory import get_style_memory_service
+    embedding_model = get_style_memory_service().embedding_model
+    
+    embeddings_path = os.path.join(output_dir, "embeddings.npy")
+    ids_path = os.path.join(output_dir, "ids.npy")
+    
+    ids = np.empty(total, dtype=np.int64)
+    embeddings = np.lib.format.open_memmap(
+        embeddings_path,
+        mode="w+",
+        dtype=np.float32,
+        shape=(total, embedding_model.get_sentence_embedding_dimension())
+    )
+    
+    def encode_chunk(start, chunk):
+        ids[start:start + len(chunk)] = [segment_id for segment_id, _ in chunk]
+        embeddings[start:start + len(chunk)] = embedding_model.encode(
+            [source for _, source in chunk],
+            batch_size=256,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+    
+    # Segments translated after `total` was counted are left out (they're
+    # encoded on demand by the workers); limit keeps them from overflowing
+    query = db.query(Segment.id, Segment.source_en).filter(
+        Segment.translated_az.isnot(None),
+        Segment.translated_az != ""
+    ).order_by(Segment.id).limit(total).yield_per(EMBEDDING_CHUNK_SIZE)
+    
+    written = 0
+    chunk = []
+    for row in query:
+        chunk.append(row)
+        if len(chunk) == EMBEDDING_CHUNK_SIZE:
+            encode_chunk(written, chunk)
+            written += len(chunk)
+            chunk = []
+    if chunk:
+        encode_chunk(written, chunk)
+        written += len(chunk)
+    
+    embeddings.flush()
+    del embeddings
+    
+    # Segments deleted since counting leave unused rows at the end of the
+    # memmap; only the ids of written rows are saved, so they're never looked up
+    np.save(ids_path, ids[:written])
+    
+    return embeddings_path, ids_path
+
 
-def recalculate_all_metrics():
-    """Recalculate metrics for all segments."""
+def recalculate_chunk(
+    segment_ids: List[int],
+    embeddings_path: Optional[str] = None,
+    ids_path: Optional[str] = None,
+    position: int = 0
+) -> Tuple[int, int]:
+    """
+    Recalculate metrics for a chunk of segments in a worker process.
+    
+    Progress is shown as one bar per worker, on line `position`.
+    
+    Returns:
+        (calculated, errors)
+    """
+    # Precomputed source embeddings are memory-mapped and shared between workers
+    embeddings = None
+    id_to_row = None
+    if embeddings_path and ids_path:
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        # Map only this chunk's segments to their rows; ids.npy is sorted, so
+        # each id is found by binary search. Ids missing from it are encoded on demand.
+        ids = np.load(ids_path, mmap_mode="r")
+        chunk_ids = np.asarray(segment_ids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(ids, chunk_ids), max(len(ids) - 1, 0))
+        found = (ids[rows] == chunk_ids) if len(ids) else np.zeros(len(chunk_ids), dtype=bool)
+        id_to_row = dict(zip(chunk_ids[found].tolist(), rows[found].tolist()))
+    
+    db = SessionLocal()
+    try:
+        calculated = 0
+        errors = 0
+        progress = tqdm(
+            total=len(segment_ids),
+            desc=f"worker {position}",
+            unit="segment",
+            position=position,
+            mininterval=1.0
+        )
+        
+        # Load one batch of segments at a time so memory stays bounded. The
+        # batch commits would invalidate a server-side (yield_per) cursor.
+        for start in range(0, len(segment_ids), BATCH_SIZE):
+            batch_ids = segment_ids[start:start + BATCH_SIZE]
+            segments = db.query(Segment).filter(
+                Segment.id.in_(batch_ids)
+            ).order_by(Segment.id).all()
+            
+            rows = []
+            for segment in segments:
+                try:
+                    # Recalculate metrics
+                    calculate_and_store_segment_metrics(
+                        segment, db, flush=False, embeddings=embeddings, id_to_row=id_to_row
+                    )
+                    rows.append(segment_metrics_row(segment))
+                    calculated += 1
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Error calculating metrics for segment {segment.id}: {e}")
+                    db.rollback()
+                finally:
+                    # Metrics are written in bulk below, so the ORM must not flush this segment
+                    db.expunge(segment)
+            
+            write_metrics(db, rows)
+            progress.update(len(batch_ids))
+        
+        progress.close()
+        return calculated, errors
+    
+    finally:
+        db.close()
+
+
+def init_worker():
+    """Worker initializer: one torch thread per process, so workers don't oversubscribe the CPUs."""
+    import torch
+    torch.set_num_threads(1)
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may run on (respects affinity / cgroup pinning)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def recalculate_all_metrics(workers: Optional[int] = None):
+    """Recalculate metrics for all segments, split across worker processes."""
     db = SessionLocal()
     try:
-        segments = db.query(Segment).filter(
-            Segment.translated_az.isnot(None),
-            Segment.translated_az != ""
-        ).all()
+        segment_ids = [
+            segment_id for (segment_id,) in db.query(Segment.id).filter(
+                Segment.translated_az.isnot(None),
+                Segment.translated_az != ""
+            ).order_by(Segment.id)
+        ]
+        total = len(segment_ids)
         
-        print(f"Found {len(segments)} segments with translations")
-        print("Recalculating metrics...")
+        print(f"Found {total} segments with translations")
         
         calculated = 0
         errors = 0
-        
-        for idx, segment in enumerate(segments):
+        if segment_ids:
+            print("Precomputing source embeddings...")
+            embeddings_dir = tempfile.mkdtemp(prefix="segment_embeddings_")
+            embeddings_path, ids_path = precompute_segment_embeddings(db, embeddings_dir, total)
+            
+            # One contiguous id range per worker
+            workers = max(1, min(workers or min(available_cpus(), DEFAULT_MAX_WORKERS), total))
+            chunk_size = math.ceil(total / workers)
+            chunks = [segment_ids[i:i + chunk_size] for i in range(0, total, chunk_size)]
+            
+            print(f"Recalculating metrics with {len(chunks)} worker processes...")
+            
+            # spawn, so each worker opens its own DB connections and loads its
+            # own embedding model instead of inheriting the parent's
             try:
-                # Recalculate metrics
-                calculate_and_store_segment_metrics(segment, db)
-                calculated += 1
-                
-                if (idx + 1) % 10 == 0:
-                    db.commit()
-                    print(f"  Processed {idx + 1}/{len(segments)} segments...")
-            except Exception as e:
-                errors += 1
-                logger.warning(f"Error calculating metrics for segment {segment.id}: {e}")
-                db.rollback()
+                with ProcessPoolExecutor(
+                    max_workers=len(chunks),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker
+                ) as executor:
+                    worker = partial(recalculate_chunk, embeddings_path=embeddings_path, ids_path=ids_path)
+                    for chunk_calculated, chunk_errors in executor.map(worker, chunks, range(len(chunks))):
+                        calculated += chunk_calculated
+                        errors += chunk_errors
+            finally:
+                shutil.rmtree(embeddings_dir, ignore_errors=True)
         
-        db.commit()
         print(f"\n✓ Completed!")
-        print(f"  Successfully calculated: {calculated}/{len(segments)}")
+        print(f"  Successfully calculated: {calculated}/{total}")
         print(f"  Errors: {errors}")
         
         # Show statistics
@@ -57,8 +257,8 @@ def recalculate_all_metrics():
         ).count()
         
         print(f"\nStatistics:")
-        print(f"  Segments with style_similarity_score: {segments_with_score}/{len(segments)}")
-        print(f"  Segments from_style_memory=True: {segments_from_memory}/{len(segments)}")
+        print(f"  Segments with style_similarity_score: {segments_with_score}/{total}")
+        print(f"  Segments from_style_memory=True: {segments_from_memory}/{total}")
     
     finally:
         db.close()
@@ -72,7 +272,15 @@ if __name__ == "__main__":
     print("Make sure style memory is populated first:")
     print("  python3 scripts/populate_style_memory.py\n")
     
-    recalculate_all_metrics()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Number of worker processes (default: available CPUs, at most "
+                             f"{DEFAULT_MAX_WORKERS}). Each worker loads two embedding models "
+                             f"(and a CUDA context on GPU), so memory grows with every worker")
+    args = parser.parse_args()
+    
+    recalculate_all_metrics(args.workers)
     
     print("\n" + "=" * 60)
     print("✓ Done!")
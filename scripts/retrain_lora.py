@@ -5,6 +5,8 @@ import logging
 import argparse
 from pathlib import Path
 
+import orjson
+
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
@@ -36,8 +38,45 @@ def check_retrain_conditions() -> bool:
     return override_count >= settings.retrain_threshold
 
 
-def prepare_retrain_data(output_path: str) -> tuple:
-    """Prepare training data from style memory."""
+def write_jsonl(path: str, items: list, id_prefix: str):
+    """Write source/target items as a JSONL file with a single write call."""
+    buf = bytearray()
+    for idx, item in enumerate(items):
+        entry = {
+            "id": f"{id_prefix}_{idx}",
+            "en": item["source"],
+            "az": item["target"]
+        }
+        buf += orjson.dumps(entry)
+        buf += b"\n"
+    
+    with open(path, 'wb') as f:
+        f.write(buf)
+
+
+def write_parquet(path: str, items: list, id_prefix: str):
+    """Write source/target items as a zstd-compressed Parquet file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    table = pa.table({
+        "id": [f"{id_prefix}_{idx}" for idx in range(len(items))],
+        "en": [item["source"] for item in items],
+        "az": [item["target"] for item in items]
+    })
+    pq.write_table(table, path, compression="zstd")
+
+
+def prepare_retrain_data(output_path: str, output_format: str = "parquet") -> tuple:
+    """
+    Prepare training data from style memory.
+    
+    Files are written as Parquet by default; pass output_format="jsonl" for
+    human-readable files when debugging.
+    
+    Returns:
+        (train_path, val_path, train_count, val_count)
+    """
     style_memory_service = get_style_memory_service()
     
     # Get recent overrides
@@ -45,46 +84,30 @@ def prepare_retrain_data(output_path: str) -> tuple:
     
     if len(overrides) < 100:  # Minimum samples
         logger.warning(f"Not enough overrides for retraining: {len(overrides)}")
-        return None, None
-    
-    # Create JSONL files
-    import json
+        return None, None, 0, 0
     
     # Split into train/val (90/10)
     split_idx = int(len(overrides) * 0.9)
     train_data = overrides[:split_idx]
     val_data = overrides[split_idx:]
     
-    train_path = os.path.join(output_path, "retrain_train.jsonl")
-    val_path = os.path.join(output_path, "retrain_val.jsonl")
+    write = write_jsonl if output_format == "jsonl" else write_parquet
+    train_path = os.path.join(output_path, f"retrain_train.{output_format}")
+    val_path = os.path.join(output_path, f"retrain_val.{output_format}")
     
     os.makedirs(output_path, exist_ok=True)
     
     # Write train data
-    with open(train_path, 'w', encoding='utf-8') as f:
-        for idx, item in enumerate(train_data):
-            entry = {
-                "id": f"retrain_{idx}",
-                "en": item["source"],
-                "az": item["target"]
-            }
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    write(train_path, train_data, id_prefix="retrain")
     
     # Write val data
-    with open(val_path, 'w', encoding='utf-8') as f:
-        for idx, item in enumerate(val_data):
-            entry = {
-                "id": f"retrain_val_{idx}",
-                "en": item["source"],
-                "az": item["target"]
-            }
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    write(val_path, val_data, id_prefix="retrain_val")
     
     logger.info(f"Prepared {len(train_data)} train and {len(val_data)} val samples")
-    return train_path, val_path
+    return train_path, val_path, len(train_data), len(val_data)
 
 
-def retrain_model():
+def retrain_model(output_format: str = "parquet"):
     """Main retraining function."""
     logger.info("Starting retraining process")
     
@@ -116,7 +139,7 @@ def retrain_model():
     try:
         # Prepare data
         data_dir = os.path.join(settings.output_dir, "retrain_data")
-        train_path, val_path = prepare_retrain_data(data_dir)
+        train_path, val_path, train_count, val_count = prepare_retrain_data(data_dir, output_format)
         
         if not train_path or not val_path:
             logger.error("Failed to prepare training data")
@@ -145,8 +168,8 @@ def retrain_model():
             if training_run:
                 training_run.status = "completed"
                 training_run.model_path = model_output_dir
-                training_run.train_samples = len(open(train_path).readlines())
-                training_run.validation_samples = len(open(val_path).readlines())
+                training_run.train_samples = train_count
+                training_run.validation_samples = val_count
                 training_run.bleu_score = eval_results.get("eval_bleu", 0)
                 training_run.completed_at = datetime.now()
                 db.commit()
@@ -179,15 +202,17 @@ def retrain_model():
 def main():
     parser = argparse.ArgumentParser(description="Retrain translation model")
     parser.add_argument("--force", action="store_true", help="Force retraining regardless of conditions")
+    parser.add_argument("--format", default="parquet", choices=["parquet", "jsonl"],
+                       help="Training data file format (jsonl for debugging)")
     
     args = parser.parse_args()
     
     if args.force:
         logger.info("Force retraining enabled")
-        retrain_model()
+        retrain_model(args.format)
     else:
         if check_retrain_conditions():
-            retrain_model()
+            retrain_model(args.format)
         else:
             logger.info("Retraining conditions not met")
 
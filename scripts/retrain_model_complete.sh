@@ -24,8 +24,8 @@ if [ $? -ne 0 ]; then
 fi
 
 # Get the latest training run ID and version
-TRAIN_FILE="data/processed/retrain_combined_train.jsonl"
-VAL_FILE="data/processed/retrain_combined_val.jsonl"
+TRAIN_FILE="data/processed/retrain_combined_train.parquet"
+VAL_FILE="data/processed/retrain_combined_val.parquet"
 
 if [ ! -f "$TRAIN_FILE" ] || [ ! -f "$VAL_FILE" ]; then
     echo "ERROR: Training data files not found!"
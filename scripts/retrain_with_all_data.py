@@ -1,145 +1,311 @@
 """Retrain model using both static training data and database segments."""
+import hashlib
 import sys
-import json
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+import numpy as np
+import orjson
+
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from backend.models.database import SessionLocal, Override, Segment, TrainingRun
+from sqlalchemy import func
+
+from backend.models.database import SessionLocal, Override, Segment, StyleMemory, TrainingRun
 from config.settings import settings
 
-def prepare_combined_training_data():
-    """Prepare training data from both static files and database segments."""
-    db = SessionLocal()
-    training_data = []
+# Bytes read per chunk when scanning JSONL files
+READ_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Buffer size for the train/val output files
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Rows per Parquet row group when writing the train/val files
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# Fingerprint of the inputs of the last export, to skip unchanged reruns
+PREPARE_CACHE_FILE = Path("data/processed/.prepare_cache.json")
+
+try:
+    import xxhash
+    
+    def example_hash(source: str, target: str) -> int:
+        """64-bit hash of a (source, target) pair, used to drop duplicate examples."""
+        return xxhash.xxh3_64_intdigest(source.encode() + b'\t' + target.encode())
+except ImportError:
+    def example_hash(source: str, target: str) -> int:
+        """64-bit hash of a (source, target) pair, used to drop duplicate examples."""
+        digest = hashlib.blake2b(source.encode() + b'\t' + target.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+# One JSON line per translated segment, with its latest override as the
+# target if it has one (highest priority), otherwise the model translation.
+# The latest overrides come from one DISTINCT ON pass over
+# idx_overrides_segment_created (segment_id, created_at DESC).
+# CSV with control-character QUOTE/DELIMITER writes the JSON text as-is;
+# the text format would escape its backslashes.
+SEGMENTS_EXPORT_SQL = """
+    COPY (
+        SELECT jsonb_build_object(
+            'source', s.source_en,
+            'target', COALESCE(o.new_translation, s.translated_az)
+        )::text
+        FROM segments s
+        LEFT JOIN (
+            SELECT DISTINCT ON (segment_id) segment_id, new_translation
+            FROM overrides
+            ORDER BY segment_id, created_at DESC
+        ) o ON o.segment_id = s.id
+        WHERE s.translated_az IS NOT NULL AND s.translated_az <> ''
+    ) TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')
+"""
+
+def iter_jsonl_lines(path: Path, chunk_size: int = READ_CHUNK_SIZE):
+    """Yield the non-empty lines of a JSONL file as bytes, reading it in large chunks."""
+    residual = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf = residual + chunk
+            start = 0
+            end = buf.find(b'\n', start)
+            while end != -1:
+                if end > start:
+                    yield buf[start:end]
+                start = end + 1
+                end = buf.find(b'\n', start)
+            # Keep the partial last line for the next chunk
+            residual = buf[start:]
+    if residual.strip():
+        yield residual
+
+def copy_lines_at_offsets(source_path: Path, offsets: np.ndarray, output_path: Path):
+    """
+    Copy the lines starting at the given byte offsets of source_path to output_path.
+    
+    Lines are copied verbatim: every line of the combined file written by this
+    script already ends in a newline, so none is added.
+    """
+    with open(source_path, 'rb') as source, open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        for offset in offsets.tolist():
+            source.seek(offset)
+            f.write(source.readline())
+
+def write_parquet_at_offsets(source_path: Path, offsets: np.ndarray, output_path: Path):
+    """Write the JSON lines at the given byte offsets of source_path as a source/target Parquet file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema([("source", pa.string()), ("target", pa.string())])
+    with open(source_path, 'rb') as source, pq.ParquetWriter(output_path, schema, compression="zstd") as writer:
+        # One row group at a time, so memory stays bounded
+        for start in range(0, len(offsets), PARQUET_ROW_GROUP_SIZE):
+            sources, targets = [], []
+            for offset in offsets[start:start + PARQUET_ROW_GROUP_SIZE].tolist():
+                source.seek(offset)
+                data = orjson.loads(source.readline())
+                sources.append(data["source"])
+                targets.append(data["target"])
+            writer.write_table(pa.table({"source": sources, "target": targets}, schema=schema))
+
+def compute_input_fingerprint(db, static_train_file: Path) -> dict:
+    """Describe the export inputs cheaply (file stat, row counts and latest timestamps)."""
+    def describe(count, latest):
+        return [count, latest.isoformat() if latest else None]
     
+    # All three tables in a single round-trip (scalar subqueries)
+    row = db.query(
+        db.query(func.count(Segment.id)).scalar_subquery(),
+        db.query(func.max(Segment.updated_at)).scalar_subquery(),
+        db.query(func.count(Override.id)).scalar_subquery(),
+        db.query(func.max(Override.created_at)).scalar_subquery(),
+        db.query(func.count(StyleMemory.id)).scalar_subquery(),
+        db.query(func.max(StyleMemory.approved_at)).scalar_subquery()
+    ).one()
+    
+    static_stat = static_train_file.stat() if static_train_file.exists() else None
+    return {
+        "static": [static_stat.st_size, static_stat.st_mtime_ns] if static_stat else None,
+        "segments": describe(row[0], row[1]),
+        "overrides": describe(row[2], row[3]),
+        "style_memory": describe(row[4], row[5])
+    }
+
+def prepare_combined_training_data(db, use_cache: bool = True, output_format: str = "parquet"):
+    """
+    Prepare training data from both static files and database segments.
+    
+    The train/val files are written as Parquet by default; pass
+    output_format="jsonl" for human-readable files when debugging.
+    
+    If the inputs are unchanged since the last run (and its files still
+    exist), the previous train/val files are returned without re-exporting.
+    """
+    output_dir = Path("data/processed")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    static_train_file = Path("data/processed/combined_train.jsonl")
+    fingerprint = compute_input_fingerprint(db, static_train_file)
+    if use_cache and PREPARE_CACHE_FILE.exists():
+        cached = orjson.loads(PREPARE_CACHE_FILE.read_bytes())
+        if (
+            cached.get("fingerprint") == fingerprint
+            and cached.get("output_format") == output_format
+            and Path(cached["train_file"]).exists()
+            and Path(cached["val_file"]).exists()
+        ):
+            print("Inputs unchanged since the last run, reusing prepared training data")
+            print(f"  Train: {cached['train_file']}")
+            print(f"  Val: {cached['val_file']}")
+            return cached["train_file"], cached["val_file"], cached["total"]
+    
+    # All examples are streamed into one combined file; only the byte
+    # offset of each line is kept in memory for the shuffle/split below
+    combined_file = output_dir / "retrain_combined_all.jsonl"
+    offsets = array('q')
+    
+    # Style memory entries are only added for sources not seen in the
+    # static or segment data, so fetch them first and tick them off while streaming
+    print("Loading style memory entries...")
+    from backend.services.style_memory import get_style_memory_service
+    style_memory_service = get_style_memory_service()
+    
+    pending_style_memories = {}
     try:
-        # 1. Load static training data if exists
-        static_train_file = Path("data/processed/combined_train.jsonl")
-        static_val_file = Path("data/processed/combined_val.jsonl")
+        # Get recent style memory entries (these are editor-approved)
+        for entry in style_memory_service.get_recent_overrides(limit=1000):
+            source = entry.get("source", "")
+            target = entry.get("target", "")
+            if source and target:
+                pending_style_memories.setdefault(source.strip().lower(), entry)
+    except Exception as e:
+        print(f"  Warning: Could not load style memory entries: {e}")
+    
+    with open(combined_file, 'wb') as out:
+        # Hashes of the (source, target) pairs written so far; repeats are skipped
+        seen = set()
+        duplicate_count = 0
+        
+        def write_example(source: str, target: str) -> bool:
+            nonlocal duplicate_count
+            pending_style_memories.pop(source.strip().lower(), None)
+            h = example_hash(source, target)
+            if h in seen:
+                duplicate_count += 1
+                return False
+            seen.add(h)
+            offsets.append(out.tell())
+            out.write(orjson.dumps({"source": source, "target": target}) + b'\n')
+            return True
         
+        # 1. Load static training data if exists
         static_count = 0
         if static_train_file.exists():
             print(f"Loading static training data from {static_train_file}...")
-            with open(static_train_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        data = json.loads(line)
-                        # Convert to standard format
-                        if "source" in data and "target" in data:
-                            training_data.append({
-                                "source": data["source"],
-                                "target": data["target"]
-                            })
+            for line in iter_jsonl_lines(static_train_file):
+                if line.strip():
+                    data = orjson.loads(line)
+                    # Convert to standard format
+                    if "source" in data and "target" in data:
+                        if write_example(data["source"], data["target"]):
                             static_count += 1
             print(f"  Loaded {static_count} examples from static data")
         
-        # 2. Get all segments with translations from database
-        print("Loading segments from database...")
-        segments = db.query(Segment).filter(
-            Segment.translated_az.isnot(None),
-            Segment.translated_az != ""
-        ).all()
+        # 2. Export segments with translations straight from Postgres; the
+        # database builds each JSON line, so no rows pass through the ORM
+        print("Exporting segments from database...")
+        copy_start = out.tell()
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(SEGMENTS_EXPORT_SQL, out)
+        finally:
+            cursor.close()
+        out.flush()
         
+        # Index the exported lines and tick off their sources. Duplicate
+        # lines stay in the combined file but get no offset, so they're
+        # never copied into train/val.
         segment_count = 0
-        for segment in segments:
-            # Check if there's an override (preferred translation)
-            override = db.query(Override).filter(
-                Override.segment_id == segment.id
-            ).order_by(Override.created_at.desc()).first()
-            
-            if override:
-                # Use override as preferred translation (highest priority)
-                training_data.append({
-                    "source": segment.source_en,
-                    "target": override.new_translation
-                })
-                segment_count += 1
-            elif segment.translated_az:
-                # Use the model translation
-                training_data.append({
-                    "source": segment.source_en,
-                    "target": segment.translated_az
-                })
-                segment_count += 1
-        
-        # 3. Get style memory entries (approved translations)
-        print("Loading style memory entries...")
-        from backend.services.style_memory import get_style_memory_service
-        style_memory_service = get_style_memory_service()
+        with open(combined_file, 'rb') as exported:
+            exported.seek(copy_start)
+            offset = copy_start
+            for line in exported:
+                data = orjson.loads(line)
+                pending_style_memories.pop(data["source"].strip().lower(), None)
+                h = example_hash(data["source"], data["target"])
+                if h in seen:
+                    duplicate_count += 1
+                else:
+                    seen.add(h)
+                    offsets.append(offset)
+                    segment_count += 1
+                offset += len(line)
         
+        # 3. Style memory entries (approved translations) not already present
         style_memory_count = 0
-        try:
-            # Get recent style memory entries (these are editor-approved)
-            style_memories = style_memory_service.get_recent_overrides(limit=1000)
-            for entry in style_memories:
-                # Check if we already have this in training data (from overrides)
-                # to avoid duplicates
-                source = entry.get("source", "")
-                target = entry.get("target", "")
-                if source and target:
-                    # Check for duplicates
-                    is_duplicate = any(
-                        item.get("source", "").strip().lower() == source.strip().lower()
-                        for item in training_data
-                    )
-                    if not is_duplicate:
-                        training_data.append({
-                            "source": source,
-                            "target": target
-                        })
-                        style_memory_count += 1
-            print(f"  Loaded {style_memory_count} additional examples from style memory")
-        except Exception as e:
-            print(f"  Warning: Could not load style memory entries: {e}")
-        
-        print(f"  Loaded {segment_count} examples from database segments")
-        print(f"  Loaded {style_memory_count} examples from style memory")
-        print(f"  Total training examples: {len(training_data)}")
-        
-        if len(training_data) == 0:
-            print("ERROR: No training data available!")
-            return None, None, None
-        
-        # 4. Shuffle and split into train/val (80/20)
-        import random
-        random.shuffle(training_data)
-        
-        val_size = max(1, len(training_data) // 5)  # At least 1 for validation
-        val_data = training_data[:val_size]
-        train_data = training_data[val_size:]
-        
-        # 5. Save to files
-        output_dir = Path("data/processed")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        train_file = output_dir / "retrain_combined_train.jsonl"
-        val_file = output_dir / "retrain_combined_val.jsonl"
-        
-        print(f"\nSaving training data...")
-        with open(train_file, 'w', encoding='utf-8') as f:
-            for item in train_data:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-        
-        with open(val_file, 'w', encoding='utf-8') as f:
-            for item in val_data:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-        
-        print(f"  Train: {train_file} ({len(train_data)} examples)")
-        print(f"  Val: {val_file} ({len(val_data)} examples)")
-        
-        return str(train_file), str(val_file), len(training_data)
+        for entry in list(pending_style_memories.values()):
+            if write_example(entry["source"], entry["target"]):
+                style_memory_count += 1
+        print(f"  Loaded {style_memory_count} additional examples from style memory")
+    
+    total = len(offsets)
+    print(f"  Loaded {segment_count} examples from database segments")
+    print(f"  Loaded {style_memory_count} examples from style memory")
+    print(f"  Skipped {duplicate_count} duplicate examples")
+    print(f"  Total training examples: {total}")
     
-    finally:
-        db.close()
+    if total == 0:
+        print("ERROR: No training data available!")
+        return None, None, None
+    
+    # 4. Split into train/val (80/20) by sampling the validation lines. There
+    # is no full shuffle: the trainer reshuffles the training set every
+    # epoch, so both splits keep file order and are read near-sequentially.
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    
+    val_size = max(1, total // 5)  # At least 1 for validation
+    val_mask = np.zeros(total, dtype=bool)
+    val_mask[np.random.default_rng().choice(total, val_size, replace=False)] = True
+    val_offsets = offsets[val_mask]
+    train_offsets = offsets[~val_mask]
+    
+    # 5. Save to files by seeking to each line of the combined file
+    write = copy_lines_at_offsets if output_format == "jsonl" else write_parquet_at_offsets
+    train_file = output_dir / f"retrain_combined_train.{output_format}"
+    val_file = output_dir / f"retrain_combined_val.{output_format}"
+    
+    print(f"\nSaving training data...")
+    # The two files are independent, so write them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(write, combined_file, train_offsets, train_file),
+            executor.submit(write, combined_file, val_offsets, val_file)
+        ]
+        for future in futures:
+            future.result()
+    
+    print(f"  Train: {train_file} ({len(train_offsets)} examples)")
+    print(f"  Val: {val_file} ({len(val_offsets)} examples)")
+    
+    PREPARE_CACHE_FILE.write_bytes(orjson.dumps({
+        "fingerprint": fingerprint,
+        "output_format": output_format,
+        "train_file": str(train_file),
+        "val_file": str(val_file),
+        "total": total
+    }))
+    
+    return str(train_file), str(val_file), total
 
 
-def create_training_run_record(version: str, train_samples: int, val_samples: int):
+def create_training_run_record(db, version: str, train_samples: int, val_samples: int):
     """Create a training run record in the database."""
-    db = SessionLocal()
     try:
         training_run = TrainingRun(
             version=version,
@@ -149,18 +315,19 @@ def create_training_run_record(version: str, train_samples: int, val_samples: in
             started_at=datetime.now()
         )
         db.add(training_run)
+        # The flush assigns the id; no refresh round-trip needed after commit
+        db.flush()
+        run_id = training_run.id
         db.commit()
-        db.refresh(training_run)
-        return training_run.id
+        return run_id
     except Exception as e:
         db.rollback()
         print(f"Error creating training run record: {e}")
         return None
-    finally:
-        db.close()
 
 
 def update_training_run_metrics(
+    db,
     run_id: int,
     model_path: str,
     bleu_score: float = None,
@@ -169,7 +336,6 @@ def update_training_run_metrics(
     status: str = "completed"
 ):
     """Update training run with metrics after training."""
-    db = SessionLocal()
     try:
         training_run = db.query(TrainingRun).filter(TrainingRun.id == run_id).first()
         if training_run:
@@ -186,8 +352,6 @@ def update_training_run_metrics(
     except Exception as e:
         db.rollback()
         print(f"Error updating training run: {e}")
-    finally:
-        db.close()
 
 
 if __name__ == "__main__":
@@ -195,19 +359,32 @@ if __name__ == "__main__":
     print("Preparing Combined Training Data")
     print("=" * 60)
     
-    train_file, val_file, total_samples = prepare_combined_training_data()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true",
+                        help="Re-export training data even if the inputs are unchanged")
+    parser.add_argument("--format", default="parquet", choices=["parquet", "jsonl"],
+                        help="Train/val file format (jsonl for debugging)")
+    args = parser.parse_args()
     
-    if not train_file:
-        print("\nERROR: Failed to prepare training data!")
-        sys.exit(1)
-    
-    # Create training run record
-    version = f"nllb_finetuned_v{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    run_id = create_training_run_record(
-        version=version,
-        train_samples=int(total_samples * 0.8),
-        val_samples=int(total_samples * 0.2)
-    )
+    # One session (and pooled connection) for every database step
+    with SessionLocal() as db:
+        train_file, val_file, total_samples = prepare_combined_training_data(
+            db, use_cache=not args.force, output_format=args.format
+        )
+        
+        if not train_file:
+            print("\nERROR: Failed to prepare training data!")
+            sys.exit(1)
+        
+        # Create training run record
+        version = f"nllb_finetuned_v{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        run_id = create_training_run_record(
+            db,
+            version=version,
+            train_samples=int(total_samples * 0.8),
+            val_samples=int(total_samples * 0.2)
+        )
     
     if run_id:
         print(f"\n✓ Training run created: ID={run_id}, Version={version}")
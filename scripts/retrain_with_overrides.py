@@ -7,7 +7,7 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from backend.models.database import SessionLocal, Override, Segment
-import json
+import orjson
 
 def prepare_training_data_from_overrides():
     """Prepare training data from override records."""
@@ -38,9 +38,9 @@ def prepare_training_data_from_overrides():
         output_file = Path("data/processed/override_training_data.jsonl")
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_file, 'w', encoding='utf-8') as f:
+        with open(output_file, 'wb') as f:
             for item in training_data:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                f.write(orjson.dumps(item) + b'\n')
         
         print(f"Saved training data to {output_file}")
         return str(output_file)
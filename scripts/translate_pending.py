@@ -1,7 +1,10 @@
 """Manually translate pending segments."""
 import sys
+import time
 from pathlib import Path
 
+from tqdm import tqdm
+
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
@@ -9,58 +12,78 @@ sys.path.insert(0, str(project_root))
 from backend.models.database import SessionLocal, Segment, Book
 from backend.services.translation import get_translation_service
 
-def translate_pending_segments(book_id=None, limit=10):
-    """Translate pending segments."""
+# Segments translated per model call (and written per bulk update/commit)
+TRANSLATE_BATCH_SIZE = 32
+
+def translate_pending_segments(book_id=None, limit=10, verbose=False):
+    """Translate pending segments; verbose prints each translation."""
     db = SessionLocal()
     try:
-        # Get pending segments
-        query = db.query(Segment).filter(Segment.status == "pending")
+        # Pending segments (only the columns needed, not full ORM objects)
+        query = db.query(Segment.id, Segment.source_en).filter(Segment.status == "pending")
         if book_id:
             query = query.filter(Segment.book_id == book_id)
         
-        segments = query.limit(limit).all()
+        total = min(query.count(), limit)
         
-        if not segments:
+        if not total:
             print("No pending segments found")
-            return
+            return 0
         
-        print(f"Found {len(segments)} pending segments")
+        print(f"Found {total} pending segments")
         
         # Load translation service
         print("Loading translation service...")
         translation_service = get_translation_service()
         print("Translation service loaded!")
         
-        # Translate segments
+        # Translate segments, TRANSLATE_BATCH_SIZE per model call. Each batch
+        # is loaded by id (keyset paging), so only one batch is held in memory
+        # and the per-batch commits don't invalidate an open cursor.
         translated = 0
-        for idx, segment in enumerate(segments):
+        processed = 0
+        last_id = 0
+        updates = []
+        progress = tqdm(total=total, unit="segment", mininterval=1.0)
+        while processed < total:
+            batch = query.filter(Segment.id > last_id).order_by(Segment.id).limit(
+                min(TRANSLATE_BATCH_SIZE, total - processed)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            
             try:
-                print(f"\n[{idx+1}/{len(segments)}] Translating segment {segment.id}...")
-                print(f"  Source: {segment.source_en[:100]}...")
-                
-                translated_az = translation_service.translate(segment.source_en)
-                segment.translated_az = translated_az
-                segment.status = "translated"
-                translated += 1
-                
-                print(f"  ✓ Translated: {translated_az[:100]}...")
-                
-                # Commit every 5 segments
-                if (idx + 1) % 5 == 0:
-                    db.commit()
-                    print(f"  Committed {idx+1} segments")
+                translations = translation_service.translate_batch(
+                    [source_en for _, source_en in batch],
+                    batch_size=TRANSLATE_BATCH_SIZE
+                )
+                for (segment_id, source_en), translated_az in zip(batch, translations):
+                    updates.append({"id": segment_id, "translated_az": translated_az, "status": "translated"})
+                    translated += 1
+                    if verbose:
+                        tqdm.write(f"  ✓ {segment_id}: {source_en[:100]}... -> {translated_az[:100]}...")
             except Exception as e:
-                print(f"  ✗ Error: {e}")
-                segment.status = "error"
+                tqdm.write(f"  ✗ Error translating segments {batch[0][0]}-{last_id}: {e}")
+                updates.extend({"id": segment_id, "status": "error"} for segment_id, _ in batch)
+            
+            # Write and commit each batch
+            db.bulk_update_mappings(Segment, updates)
+            db.commit()
+            updates.clear()
+            processed += len(batch)
+            progress.update(len(batch))
+        progress.close()
         
-        db.commit()
-        print(f"\n✓ Completed! Translated {translated}/{len(segments)} segments")
+        print(f"\n✓ Completed! Translated {translated}/{processed} segments")
+        return processed
     
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
         db.rollback()
+        return 0
     finally:
         db.close()
 
@@ -69,7 +92,28 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--book-id", type=int, help="Book ID to translate")
     parser.add_argument("--limit", type=int, default=10, help="Number of segments to translate")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and poll for pending segments, reusing the loaded model")
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                        help="Seconds to wait between polls when nothing is pending (with --daemon)")
+    parser.add_argument("--compile", action="store_true",
+                        help="Compile the model with torch.compile (CUDA; pays off with --daemon)")
+    parser.add_argument("--verbose", action="store_true", help="Print every source and translation")
     args = parser.parse_args()
     
-    translate_pending_segments(args.book_id, args.limit)
+    if args.compile:
+        get_translation_service().compile()
+    
+    if args.daemon:
+        # The translation service is loaded once and stays in memory between polls
+        print(f"Polling for pending segments every {args.poll_interval}s (Ctrl+C to stop)...")
+        try:
+            while True:
+                # Poll again right away while there's a backlog
+                if not translate_pending_segments(args.book_id, args.limit, args.verbose):
+                    time.sleep(args.poll_interval)
+        except KeyboardInterrupt:
+            print("\nStopped")
+    else:
+        translate_pending_segments(args.book_id, args.limit, args.verbose)
 